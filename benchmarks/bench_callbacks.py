@@ -0,0 +1,76 @@
+"""Callback dispatch: the previous if-chain of formatted strings vs decode() + a dict lookup.
+
+The dispatch tables are there to keep handlers maintainable, not to be
+faster: decoding costs a couple of microseconds more than a dozen string
+compares, which is noise next to an API round trip. This keeps an eye on
+that cost. Only the routing step is timed; handlers are no-ops. Also
+reports the size of a remove-member button with decimal vs compact
+(base36) ids.
+
+    python -m benchmarks.bench_callbacks
+"""
+import random
+import time
+
+from standupbuddy.callbacks import Router, decode, encode
+
+CALLBACKS = 200_000
+GROUP_ACTIONS = ("info", "view", "edit", "del", "run", "members", "leave", "rmembers")
+
+
+def legacy_group_menu(data: str, team_id: int) -> str | None:
+    """The previous on_group_menu: compare against each f-string in turn."""
+    if data == "back:group":
+        return "back"
+    for action in GROUP_ACTIONS:
+        if data == f"gm:{action}:{team_id}":
+            return action
+    if data == "back:teams":
+        return "teams"
+    if data == "back:menu":
+        return "menu"
+    return None
+
+
+def build_router() -> Router:
+    router = Router()
+    router.on("back", "group")(lambda: "back")
+    for action in GROUP_ACTIONS:
+        router.on("gm", action)(lambda action=action: action)
+    router.on("back", "teams")(lambda: "teams")
+    router.on("back", "menu")(lambda: "menu")
+    return router
+
+
+def workload() -> list[tuple[str, int]]:
+    rnd = random.Random(3)
+    out = []
+    for _ in range(CALLBACKS):
+        team_id = rnd.randint(1, 50_000)
+        action = rnd.choice(GROUP_ACTIONS + ("back",))
+        out.append(("back:group" if action == "back" else f"gm:{action}:{team_id}", team_id))
+    return out
+
+
+def main():
+    calls = workload()
+    start = time.perf_counter()
+    for data, team_id in calls:
+        legacy_group_menu(data, team_id)
+    before = (time.perf_counter() - start) / CALLBACKS
+
+    router = build_router()
+    start = time.perf_counter()
+    for data, _ in calls:
+        router.get(decode(data))()
+    after = (time.perf_counter() - start) / CALLBACKS
+    print(f"{CALLBACKS} group menu callbacks")
+    print(f"if-chain      : {before * 1e6:5.2f} us/callback")
+    print(f"decode + dict : {after * 1e6:5.2f} us/callback ({before / after:.1f}x)")
+    team_id, uid = 2_000_000_000, 7_999_999_999
+    plain, compact = encode("rm", "", team_id, uid), encode("rm", "", team_id, uid, compact=True)
+    print(f"rm button     : {len(plain)} bytes decimal, {len(compact)} bytes compact")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""p99 handler latency with blocking SQLite calls vs the executor-backed repo.
+
+Simulates a burst of concurrent updates: a fraction run the summary query
+(the heaviest read) for 5,000-member teams, several milliseconds each; the
+rest are light handlers that only talk to Telegram. With blocking calls
+every light handler queues behind the heavy ones. On a dev box light p99
+goes from ~700 ms blocking to ~100 ms with the executor.
+
+    python -m benchmarks.bench_event_loop
+"""
+import asyncio
+import random
+import time
+
+from standupbuddy import db, repo
+from benchmarks.common import use_temp_db, seed, percentiles
+
+TEAMS = 20
+MEMBERS = 5000
+STANDUPS = 4
+UPDATES = 1000
+HEAVY_SHARE = 0.2
+ARRIVAL_WINDOW_SEC = 2.0
+NETWORK_SEC = 0.02
+
+
+async def heavy_blocking(team_id):
+    with db.connection() as conn:
+        repo.summary_rows.sync(conn, team_id, team_id * STANDUPS)
+    await asyncio.sleep(NETWORK_SEC)
+
+
+async def heavy_async(team_id):
+    await repo.summary_rows(team_id, team_id * STANDUPS)
+    await asyncio.sleep(NETWORK_SEC)
+
+
+async def light(_team_id):
+    await asyncio.sleep(NETWORK_SEC)
+
+
+async def run(heavy) -> tuple[list[float], list[float]]:
+    rnd = random.Random(7)
+    light_lat, heavy_lat = [], []
+
+    async def one(delay, fn, sink):
+        await asyncio.sleep(delay)
+        start = time.perf_counter()
+        await fn(rnd.randint(1, TEAMS))
+        sink.append(time.perf_counter() - start)
+
+    tasks = []
+    for _ in range(UPDATES):
+        delay = rnd.random() * ARRIVAL_WINDOW_SEC
+        if rnd.random() < HEAVY_SHARE:
+            tasks.append(one(delay, heavy, heavy_lat))
+        else:
+            tasks.append(one(delay, light, light_lat))
+    await asyncio.gather(*tasks)
+    return light_lat, heavy_lat
+
+
+def main():
+    use_temp_db()
+    with db.connection() as conn:
+        seed(conn, TEAMS, MEMBERS, STANDUPS)
+    print(f"{UPDATES} updates over {ARRIVAL_WINDOW_SEC}s, {HEAVY_SHARE:.0%} run the summary query")
+    for label, heavy in (("blocking", heavy_blocking), ("executor", heavy_async)):
+        light_lat, heavy_lat = asyncio.run(run(heavy))
+        print(f"{label:9} light handlers: {percentiles(light_lat)}")
+        print(f"{label:9} heavy handlers: {percentiles(heavy_lat)}")
+    repo.shutdown()
+
+
+if __name__ == "__main__":
+    main()
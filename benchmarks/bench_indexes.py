@@ -0,0 +1,81 @@
+"""Hot lookups on a million-row `updates` table before and after the index migrations.
+
+    python -m benchmarks.bench_indexes
+"""
+import random
+import time
+
+from standupbuddy import db
+from standupbuddy.migrations import migrate
+from benchmarks.common import use_temp_db, seed
+
+TEAMS = 4000
+MEMBERS = 25
+STANDUPS = 10
+SCAN_ROUNDS = 20
+INDEXED_ROUNDS = 2000
+
+LOOKUPS = {
+    "standup by (team_id, date_iso)": (
+        "SELECT id FROM standups WHERE team_id=? AND date_iso=?",
+        lambda r: (r.randint(1, TEAMS), f"2024-01-{r.randint(1, STANDUPS):02d}"),
+    ),
+    "update by (standup_id, tg_id)": (
+        "SELECT id, answered FROM updates WHERE standup_id=? AND tg_id=?",
+        lambda r: _standup_and_member(r),
+    ),
+    "unanswered by standup_id": (
+        "SELECT tg_id FROM updates WHERE standup_id=? AND answered=0",
+        lambda r: (r.randint(1, TEAMS * STANDUPS),),
+    ),
+    "teams of a user": (
+        "SELECT team_id FROM team_members WHERE tg_id=?",
+        lambda r: (r.randint(1, TEAMS * MEMBERS),),
+    ),
+}
+
+
+def _standup_and_member(r):
+    team = r.randint(1, TEAMS)
+    return (team - 1) * STANDUPS + r.randint(1, STANDUPS), (team - 1) * MEMBERS + r.randint(1, MEMBERS)
+
+
+def measure(conn, rounds: int) -> dict[str, float]:
+    results = {}
+    for label, (sql, params) in LOOKUPS.items():
+        rnd = random.Random(1)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            conn.execute(sql, params(rnd)).fetchall()
+        results[label] = (time.perf_counter() - start) / rounds
+    return results
+
+
+def drop_indexes(conn) -> None:
+    """Roll the database back to the pre-index state so migrate() re-applies 2 and 3."""
+    for name in ("idx_standups_team_date", "idx_updates_standup_answered", "idx_team_members_tg", "ux_updates_standup_user"):
+        conn.execute(f"DROP INDEX {name}")
+    conn.execute("DELETE FROM schema_version WHERE version IN (2, 3)")
+    conn.commit()
+
+
+def main():
+    use_temp_db()
+    with db.connection() as conn:
+        start = time.perf_counter()
+        seed(conn, TEAMS, MEMBERS, STANDUPS)
+        rows = conn.execute("SELECT COUNT(*) FROM updates").fetchone()[0]
+        print(f"seeded {rows} updates in {time.perf_counter() - start:.1f}s")
+        drop_indexes(conn)
+        before = measure(conn, SCAN_ROUNDS)
+        start = time.perf_counter()
+        migrate(conn)
+        print(f"migrations took {time.perf_counter() - start:.1f}s")
+        after = measure(conn, INDEXED_ROUNDS)
+    for label in LOOKUPS:
+        b, a = before[label] * 1000, after[label] * 1000
+        print(f"{label:32} before={b:8.3f}ms after={a:7.3f}ms speedup={b / a:8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
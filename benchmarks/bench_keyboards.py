@@ -0,0 +1,108 @@
+"""Inline keyboards on the callback hot path: rebuilt per click vs prebuilt/memoized.
+
+Each simulated click builds the markup a handler replies with and serializes
+it the way the Bot API request does.
+
+    python -m benchmarks.bench_keyboards
+"""
+import json
+import random
+import time
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from standupbuddy import keyboards
+
+CLICKS = 20_000
+TEAMS = 200
+
+
+def legacy_group_menu(team_row, is_manager: bool) -> InlineKeyboardMarkup:
+    """The previous implementation: a fresh object tree for every call."""
+    team_id = team_row["id"]
+    btns = []
+    if team_row["reminder_time"]:
+        btns.append([InlineKeyboardButton("📄 Посмотреть расписание", callback_data=f"gm:view:{team_id}")])
+        if is_manager:
+            btns.append([InlineKeyboardButton("✏️ Редактировать расписание", callback_data=f"gm:edit:{team_id}")])
+            btns.append([InlineKeyboardButton("🗑 Удалить расписание", callback_data=f"gm:del:{team_id}")])
+            btns.append([InlineKeyboardButton("▶️ Запустить сейчас", callback_data=f"gm:run:{team_id}")])
+    elif is_manager:
+        btns.append([InlineKeyboardButton("➕ Создать расписание", callback_data=f"gm:edit:{team_id}")])
+    btns.append([InlineKeyboardButton("👥 Участники", callback_data=f"gm:members:{team_id}")])
+    btns.append([InlineKeyboardButton("ℹ️ Инфо о группе", callback_data=f"gm:info:{team_id}")])
+    btns.append([InlineKeyboardButton("↩️ Выйти из группы", callback_data=f"gm:leave:{team_id}")])
+    if is_manager:
+        btns.append([InlineKeyboardButton("❌ Удалить участника…", callback_data=f"gm:rmembers:{team_id}")])
+    btns.append([InlineKeyboardButton("◀️ К списку групп", callback_data="back:teams")])
+    btns.append([InlineKeyboardButton("🏠 В меню", callback_data="back:menu")])
+    return InlineKeyboardMarkup(btns)
+
+
+def legacy_custom_days(selected: set[int]) -> InlineKeyboardMarkup:
+    rows = []
+    for i, n in enumerate(["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]):
+        rows.append([InlineKeyboardButton(f"{'✅' if i in selected else '☐'} {n}", callback_data=f"sch:custom:toggle:{i}")])
+    rows.append([InlineKeyboardButton("Сохранить", callback_data="sch:custom:save"),
+                 InlineKeyboardButton("Сброс", callback_data="sch:custom:reset")])
+    rows.append([InlineKeyboardButton("◀️ Назад", callback_data="back:schedule")])
+    return InlineKeyboardMarkup(rows)
+
+
+def legacy_tz_offsets() -> InlineKeyboardMarkup:
+    rows, row = [], []
+    for off in range(-12, 15):
+        row.append(InlineKeyboardButton(f"UTC{off:+d}", callback_data=f"tzo:{off}"))
+        if len(row) == 3:
+            rows.append(row); row = []
+    rows.append([InlineKeyboardButton("◀️ Назад", callback_data="back:group")])
+    return InlineKeyboardMarkup(rows)
+
+
+def clicks():
+    """A mix of group menu, day picker and timezone screens over TEAMS teams."""
+    rnd = random.Random(7)
+    for _ in range(CLICKS):
+        kind = rnd.random()
+        if kind < 0.6:
+            yield "group", ({"id": rnd.randint(1, TEAMS), "reminder_time": rnd.choice(("09:00", None))}, rnd.random() < 0.3)
+        elif kind < 0.9:
+            yield "days", {d for d in range(7) if rnd.random() < 0.5}
+        else:
+            yield "tz", None
+
+
+def run(builders) -> tuple[float, float]:
+    """Seconds per click: building only, and building plus JSON serialization."""
+    workload = list(clicks())
+    start = time.perf_counter()
+    for kind, arg in workload:
+        builders[kind](arg)
+    build = (time.perf_counter() - start) / CLICKS
+    start = time.perf_counter()
+    for kind, arg in workload:
+        json.dumps(builders[kind](arg).to_dict())
+    total = (time.perf_counter() - start) / CLICKS
+    return build, total
+
+
+def main():
+    before = run({
+        "group": lambda a: legacy_group_menu(*a),
+        "days": legacy_custom_days,
+        "tz": lambda a: legacy_tz_offsets(),
+    })
+    after = run({
+        "group": lambda a: keyboards.group_menu_keyboard(a[0], a[1], 0),
+        "days": lambda a: keyboards.schedule_custom_keyboard(keyboards.days_mask(a)),
+        "tz": lambda a: keyboards.tz_offset_keyboard(),
+    })
+    print(f"{CLICKS} callbacks over {TEAMS} teams (group menu / day picker / timezones)")
+    print(f"rebuilt per click: build {before[0] * 1e6:6.1f} us, build+serialize {before[1] * 1e6:6.1f} us")
+    print(f"prebuilt/memoized: build {after[0] * 1e6:6.1f} us, build+serialize {after[1] * 1e6:6.1f} us "
+          f"({before[0] / after[0]:.0f}x / {before[1] / after[1]:.1f}x)")
+    print(f"group menu cache: {keyboards._group_menu.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
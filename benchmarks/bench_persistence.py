@@ -0,0 +1,79 @@
+"""Conversation/user_data persistence for 5,000 users: PicklePersistence vs SQLitePersistence.
+
+Times the startup load of everything stored, then one persistence round in
+which 200 users changed their data and moved to another conversation state.
+PicklePersistence rewrites its whole file for every changed key.
+
+    python -m benchmarks.bench_persistence
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+from telegram.ext import PicklePersistence
+
+from standupbuddy import repo
+from standupbuddy.persistence import SQLitePersistence
+from benchmarks.common import use_temp_db
+
+USERS = 5_000
+DIRTY = 200
+ROUNDS = 2
+
+
+def user_data(uid: int, round_no: int) -> dict:
+    return {"group_id": uid % 700, "settime_hhmm": "09:30", "settime_tz": "Europe/Moscow", "settime_days": 0b11111, "round": round_no, "team_prefix": ""}
+
+
+async def fill(persistence) -> None:
+    for uid in range(1, USERS + 1):
+        await persistence.update_user_data(uid, user_data(uid, 0))
+        await persistence.update_conversation("main", (uid, uid), 2)
+    await persistence.flush()
+
+
+async def load(persistence) -> None:
+    """What Application.initialize() asks the persistence for."""
+    await persistence.get_user_data()
+    await persistence.get_conversations("main")
+
+
+async def one_round(persistence, round_no: int) -> None:
+    """What Application.update_persistence() hands over after DIRTY users clicked something."""
+    dirty = range(round_no * DIRTY + 1, (round_no + 1) * DIRTY + 1)
+    await asyncio.gather(
+        *(persistence.update_user_data(uid, user_data(uid, round_no)) for uid in dirty),
+        *(persistence.update_conversation("main", (uid, uid), 3) for uid in dirty),
+    )
+    await persistence.flush()
+
+
+async def measure(make, make_filler) -> tuple[float, float]:
+    await fill(make_filler())
+    start = time.perf_counter()
+    persistence = make()
+    await load(persistence)
+    startup = time.perf_counter() - start
+    start = time.perf_counter()
+    for round_no in range(1, ROUNDS + 1):
+        await one_round(persistence, round_no)
+    return (time.perf_counter() - start) / ROUNDS, startup
+
+
+def main():
+    path = os.path.join(tempfile.mkdtemp(prefix="standupbuddy-bench-"), "state.pickle")
+    use_temp_db()
+    print(f"{USERS} users stored, {DIRTY} changed per round")
+    for label, make, make_filler in (
+        # The filler only writes on flush, so seeding is not quadratic.
+        ("PicklePersistence ", lambda: PicklePersistence(path, on_flush=False), lambda: PicklePersistence(path, on_flush=True)),
+        ("SQLitePersistence ", SQLitePersistence, SQLitePersistence),
+    ):
+        per_round, startup = asyncio.run(measure(make, make_filler))
+        print(f"{label}: {per_round * 1000:8.1f} ms per round, startup load {startup * 1000:6.1f} ms")
+    repo.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Answer ingestion for a user in 50 teams: per-team queries vs a prompt message id lookup.
+
+The database also holds a year of closed standups for those teams, so the
+per-team path pays for history the way a long-running deployment does.
+
+    python -m benchmarks.bench_record_answer
+"""
+import time
+
+from standupbuddy import db, repo
+from standupbuddy.utils import today_in_tz, now_utc
+from benchmarks.common import use_temp_db, seed
+
+TEAMS = 50
+MEMBERS = 20
+HISTORY = 250
+ROUNDS = 200
+USER = 1
+
+
+def per_team_record_answer(conn, uid: int, text: str) -> bool:
+    """The previous implementation: ~4 queries and a commit per team."""
+    updated_any = False
+    teams = conn.execute("SELECT team_id FROM team_members WHERE tg_id=?", (uid,)).fetchall()
+    for trow in teams:
+        team_id = trow["team_id"]
+        team = conn.execute("SELECT tz FROM teams WHERE id=?", (team_id,)).fetchone()
+        if not team: continue
+        today = today_in_tz(team["tz"]).isoformat()
+        st = conn.execute("SELECT id FROM standups WHERE team_id=? AND date_iso=? ORDER BY id DESC LIMIT 1", (team_id, today)).fetchone()
+        if not st: continue
+        upd = conn.execute("SELECT id, answered FROM updates WHERE standup_id=? AND tg_id=?", (st["id"], uid)).fetchone()
+        if not upd or upd["answered"] == 1: continue
+        with conn:
+            conn.execute("UPDATE updates SET text=?, created_utc=?, answered=1 WHERE id=?", (text, now_utc().isoformat(), upd["id"]))
+        updated_any = True
+    return updated_any
+
+
+def open_today(conn) -> int:
+    """Open a standup for every team, with USER's prompt sent as message id = standup id.
+
+    Returns the last standup id.
+    """
+    with conn:
+        for team_id in range(1, TEAMS + 1):
+            standup_id = conn.execute(
+                "INSERT INTO standups (team_id, date_iso, started_utc) VALUES (?, ?, ?)",
+                (team_id, today_in_tz("UTC+3").isoformat(), now_utc().isoformat()),
+            ).lastrowid
+            conn.execute(
+                "INSERT INTO updates (standup_id, tg_id, answered) SELECT ?, tg_id, 0 FROM team_members WHERE team_id=?",
+                (standup_id, team_id),
+            )
+            conn.execute(
+                "INSERT INTO prompt_messages (chat_id, message_id, update_id) SELECT ?, ?, id FROM updates WHERE standup_id=? AND tg_id=?",
+                (USER, standup_id, standup_id, USER),
+            )
+    return standup_id
+
+
+def run(conn, reply) -> float:
+    """Time one reply (to the last team's prompt) per round."""
+    total = 0.0
+    for _ in range(ROUNDS):
+        with conn:
+            conn.execute("UPDATE standups SET closed_utc=datetime('now') WHERE closed_utc IS NULL")
+        standup_id = open_today(conn)
+        start = time.perf_counter()
+        reply(conn, standup_id)
+        total += time.perf_counter() - start
+        assert conn.execute("SELECT answered FROM updates WHERE standup_id=? AND tg_id=?", (standup_id, USER)).fetchone()[0] == 1
+    return total / ROUNDS
+
+
+def main():
+    use_temp_db()
+    with db.connection() as conn:
+        seed(conn, TEAMS, MEMBERS, HISTORY)
+        with conn:
+            conn.executemany("INSERT OR IGNORE INTO team_members (team_id, tg_id) VALUES (?, ?)", [(t, USER) for t in range(1, TEAMS + 1)])
+            conn.execute("UPDATE standups SET closed_utc=started_utc")
+            conn.execute("UPDATE updates SET answered=1 WHERE tg_id=?", (USER,))
+        before = run(conn, lambda c, standup_id: per_team_record_answer(c, USER, "done"))
+        after = run(conn, lambda c, standup_id: repo.record_answer.sync(c, USER, "done", USER, standup_id))
+    print(f"user in {TEAMS} teams, {HISTORY} past standups per team, {ROUNDS} rounds")
+    print(f"per-team queries: {before * 1000:7.2f} ms/reply")
+    print(f"prompt lookup   : {after * 1000:7.2f} ms/reply ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Startup schedule restore for 50,000 teams: a query per team vs one bulk load.
+
+    python -m benchmarks.bench_restore
+"""
+import asyncio
+import time
+
+from standupbuddy import db, repo
+from standupbuddy.jobs import reschedule_daily_job, restore_schedules, scheduler
+from benchmarks.common import use_temp_db, seed
+
+TEAMS = 50_000
+TIMEZONES = ("UTC", "UTC+3", "Europe/Berlin", "America/New_York", "Asia/Kolkata")
+
+
+async def per_team() -> None:
+    """The previous restore_jobs: list the ids, then load each schedule separately."""
+    team_ids = [r["id"] for r in await repo.team_schedules()]
+    for team_id in team_ids:
+        await reschedule_daily_job(None, team_id)
+
+
+async def bulk() -> None:
+    await restore_schedules(None)
+
+
+def main():
+    use_temp_db()
+    with db.connection() as conn:
+        seed(conn, TEAMS, 1, 0)
+        with conn:
+            conn.execute(
+                "UPDATE teams SET reminder_time=printf('%02d:%02d', 7 + id % 4, (id % 4) * 15), tz=?1 WHERE id % 5 = 0",
+                (TIMEZONES[0],),
+            )
+            for i, tz in enumerate(TIMEZONES[1:], 1):
+                conn.execute("UPDATE teams SET tz=? WHERE id % 5 = ?", (tz, i))
+    print(f"{TEAMS} scheduled teams")
+    results = {}
+    for label, fn in (("query per team", per_team), ("bulk load     ", bulk)):
+        scheduler.load(())
+        start = time.perf_counter()
+        asyncio.run(fn())
+        results[label] = time.perf_counter() - start
+        assert len(scheduler) == TEAMS
+        print(f"{label}: {results[label] * 1000:8.1f} ms")
+    before, after = results.values()
+    print(f"speedup: {before / after:.1f}x")
+    repo.shutdown()
+
+
+if __name__ == "__main__":
+    main()
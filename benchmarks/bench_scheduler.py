@@ -0,0 +1,106 @@
+"""Daily schedules for 20,000 teams: one run_daily job per team vs minute buckets.
+
+Measures memory held by the schedule, the time to register and start it, and
+how many start callbacks run, and how late, when every team is due at once.
+The per-team jobs are registered with `misfire_grace_time=None`: with
+APScheduler's default of 1 s nearly all of them are skipped as misfired at
+this scale, which says nothing about how late they would have run.
+
+    python -m benchmarks.bench_scheduler
+"""
+import asyncio
+import gc
+import logging
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from telegram.ext import Application, ApplicationBuilder
+
+from standupbuddy.scheduler import MinuteScheduler
+from benchmarks.common import percentiles, use_temp_db
+
+TEAMS = 20_000
+DAYS = (0, 1, 2, 3, 4, 5, 6)
+DEADLINE_SEC = 60
+
+
+def build_app():
+    return ApplicationBuilder().token("0:bench").build()
+
+
+def per_team_jobs(app: Application, fire_at: datetime, on_fire) -> None:
+    for team_id in range(1, TEAMS + 1):
+        app.job_queue.run_daily(
+            on_fire, time=fire_at.timetz(), days=DAYS, name=f"daily_{team_id}", data={"team_id": team_id},
+            job_kwargs={"misfire_grace_time": None},
+        )
+
+
+def minute_buckets(app: Application, fire_at: datetime, on_fire) -> None:
+    scheduler = MinuteScheduler(lambda app, team_id: on_fire(None))
+    now = datetime.now(timezone.utc)
+    for team_id in range(1, TEAMS + 1):
+        scheduler.set_team(team_id, fire_at.time(), "UTC", DAYS, now=now)
+
+    # Stands in for the minute tick that fires at the start of this minute.
+    async def tick(ctx):
+        await scheduler.fire(ctx.application, scheduler.due(int(fire_at.timestamp() // 60)))
+
+    app.job_queue.run_once(tick, when=fire_at)
+
+
+async def measure(register) -> tuple[int, float, list[float]]:
+    """Memory and setup time with the fire time an hour away, then fire lags for real."""
+    async def noop(ctx):
+        pass
+
+    app = build_app()
+    tracemalloc.start()
+    register(app, datetime.now(timezone.utc) + timedelta(hours=1), noop)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    app = build_app()
+    started = time.perf_counter()
+    register(app, datetime.now(timezone.utc) + timedelta(hours=1), noop)
+    await app.job_queue.start()
+    setup_time = time.perf_counter() - started
+    await app.job_queue.stop()
+
+    done = asyncio.Event()
+    lags = []
+    fire_at = datetime.now(timezone.utc) + timedelta(seconds=setup_time * 2 + 3)
+
+    async def on_fire(ctx):
+        lags.append(time.time() - fire_at.timestamp())
+        if len(lags) == TEAMS:
+            done.set()
+
+    app = build_app()
+    register(app, fire_at, on_fire)
+    gc.collect()
+    await app.job_queue.start()
+    try:
+        await asyncio.wait_for(done.wait(), (fire_at - datetime.now(timezone.utc)).total_seconds() + DEADLINE_SEC)
+    except asyncio.TimeoutError:
+        pass
+    await app.job_queue.stop()
+    return memory, setup_time, lags
+
+
+def main():
+    # APScheduler logs every job it skips as misfired.
+    logging.getLogger("apscheduler").setLevel(logging.ERROR)
+    use_temp_db()  # fire() writes the teams' next runs back
+    print(f"{TEAMS} teams, all due at the same time; callbacks later than {DEADLINE_SEC}s are not counted")
+    for label, register in (("run_daily per team", per_team_jobs), ("minute buckets    ", minute_buckets)):
+        memory, setup_time, lags = asyncio.run(measure(register))
+        line = f"{label}: {memory / 1024 / 1024:6.1f} MiB, setup {setup_time:5.1f}s, fired {len(lags)}/{TEAMS}"
+        if lags:
+            line += f", lag {percentiles(lags)}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Standup creation for a 5,000-member team: per-row inserts vs one INSERT ... SELECT.
+
+    python -m benchmarks.bench_start_standup
+"""
+import time
+
+from standupbuddy import db, repo
+from standupbuddy.utils import today_in_tz, now_utc
+from benchmarks.common import use_temp_db, seed
+
+MEMBERS = 5000
+ROUNDS = 20
+
+
+def per_row_create_standup(conn, team_id: int):
+    """The previous implementation: three lookups, then one INSERT per member."""
+    team = conn.execute("SELECT id, name, tz FROM teams WHERE id=?", (team_id,)).fetchone()
+    today = today_in_tz(team["tz"]).isoformat()
+    conn.execute("SELECT id FROM standups WHERE team_id=? AND date_iso=?", (team_id, today)).fetchone()
+    members = [r["tg_id"] for r in conn.execute("SELECT tg_id FROM team_members WHERE team_id=?", (team_id,)).fetchall()]
+    with conn:
+        cur = conn.execute("INSERT INTO standups (team_id, date_iso, started_utc) VALUES (?, ?, ?)", (team_id, today, now_utc().isoformat()))
+        standup_id = cur.lastrowid
+        for uid in members:
+            conn.execute("INSERT INTO updates (standup_id, tg_id, answered) VALUES (?, ?, 0)", (standup_id, uid))
+    return team, standup_id, members
+
+
+def run(conn, fn) -> float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        _, _, members = fn(conn, 1)
+        assert len(members) == MEMBERS
+    return (time.perf_counter() - start) / ROUNDS
+
+
+def main():
+    use_temp_db()
+    with db.connection() as conn:
+        seed(conn, 1, MEMBERS, 0)
+        before = run(conn, per_row_create_standup)
+        after = run(conn, lambda c, team_id: repo.create_standup.sync(c, team_id, True))
+    print(f"{MEMBERS} members, {ROUNDS} rounds")
+    print(f"per-row inserts : {before * 1000:7.1f} ms/standup")
+    print(f"INSERT ... SELECT: {after * 1000:7.1f} ms/standup ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Timezone resolution when standups start: today's date in each team's timezone.
+
+create_standup() computes "today" in the team's timezone for every standup
+it opens, so a minute in which thousands of teams are due resolves thousands
+of timezones (the reply path no longer needs it). This compares the previous
+uncached parser with the memoized parse_tz().
+
+    python -m benchmarks.bench_tz
+"""
+import time
+from datetime import datetime
+
+import pytz
+
+from standupbuddy.utils import parse_tz, today_in_tz
+
+TEAM_TZS = ["UTC+3", "Europe/Moscow", "UTC", "America/New_York", "UTC+5:30", "Asia/Kolkata", "UTC-5", "Europe/Berlin"]
+TEAMS_DUE = 20_000
+ROUNDS = 20
+
+
+def legacy_tz_from_str(tz_str: str):
+    """The previous implementation: re-parsed and looked up on every call."""
+    if tz_str and tz_str.upper().startswith("UTC"):
+        rest = tz_str[3:]
+        sign = 1
+        if rest.startswith("+"):
+            rest = rest[1:]
+        elif rest.startswith("-"):
+            rest = rest[1:]
+            sign = -1
+        try:
+            return pytz.FixedOffset(sign * int(rest) * 60)
+        except Exception:
+            pass
+    try:
+        return pytz.timezone(tz_str)
+    except Exception:
+        return pytz.UTC
+
+
+def legacy_today_in_tz(tz_str: str):
+    return datetime.now(legacy_tz_from_str(tz_str)).date()
+
+
+def run(fn) -> float:
+    """Seconds to resolve today's date for every team due in one minute."""
+    zones = [TEAM_TZS[i % len(TEAM_TZS)] for i in range(TEAMS_DUE)]
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for tz in zones:
+            fn(tz)
+    return (time.perf_counter() - start) / ROUNDS
+
+
+def main():
+    parse_tz.cache_clear()
+    before = run(legacy_today_in_tz)
+    after = run(today_in_tz)
+    print(f"{TEAMS_DUE} standups started in one minute, {len(TEAM_TZS)} distinct timezones")
+    print(f"uncached parse: {before * 1000:7.1f} ms/minute")
+    print(f"parse_tz cache: {after * 1000:7.1f} ms/minute ({before / after:.1f}x), {parse_tz.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
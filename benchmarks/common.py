@@ -0,0 +1,70 @@
+import os
+import random
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+
+from standupbuddy import db
+from standupbuddy.config import DB_POOL_SIZE, DB_POOL_TIMEOUT_SEC
+from standupbuddy.migrations import migrate
+
+
+def use_temp_db() -> str:
+    """Point the shared connection pool at a fresh database file and migrate it."""
+    path = os.path.join(tempfile.mkdtemp(prefix="standupbuddy-bench-"), "bench.db")
+    db.pool.close()
+    db.pool = db.ConnectionPool(path, DB_POOL_SIZE, DB_POOL_TIMEOUT_SEC)
+    with db.connection() as conn:
+        migrate(conn)
+    return path
+
+
+def seed(conn, teams: int, members_per_team: int, standups_per_team: int = 1) -> None:
+    """Fill the database with synthetic teams, members, standups and updates."""
+    rnd = random.Random(42)
+    with conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO users (tg_id, name) VALUES (?, ?)",
+            ((uid, f"user{uid}") for uid in range(1, teams * members_per_team + 1)),
+        )
+        conn.executemany(
+            "INSERT INTO teams (id, name, invite_code, tz, reminder_time, reminder_days) VALUES (?, ?, ?, 'UTC+3', '09:00', '[0,1,2,3,4]')",
+            ((t, f"team{t}", f"CODE{t:08d}") for t in range(1, teams + 1)),
+        )
+        conn.executemany(
+            "INSERT INTO team_managers (team_id, tg_id) VALUES (?, ?)",
+            ((t, t * members_per_team) for t in range(1, teams + 1)),
+        )
+        conn.executemany(
+            "INSERT INTO team_members (team_id, tg_id) VALUES (?, ?)",
+            ((t, (t - 1) * members_per_team + m) for t in range(1, teams + 1) for m in range(1, members_per_team + 1)),
+        )
+        conn.executemany(
+            "INSERT INTO standups (id, team_id, date_iso, started_utc) VALUES (?, ?, ?, ?)",
+            (
+                ((t - 1) * standups_per_team + s + 1, t, f"2024-{1 + s // 28:02d}-{1 + s % 28:02d}", "2024-01-01T06:00:00+00:00")
+                for t in range(1, teams + 1) for s in range(standups_per_team)
+            ),
+        )
+        conn.executemany(
+            "INSERT INTO updates (standup_id, tg_id, text, answered) VALUES (?, ?, 'done', ?)",
+            (
+                ((t - 1) * standups_per_team + s + 1, (t - 1) * members_per_team + m, rnd.random() < 0.8)
+                for t in range(1, teams + 1) for s in range(standups_per_team) for m in range(1, members_per_team + 1)
+            ),
+        )
+
+
+@contextmanager
+def timed(label: str):
+    start = time.perf_counter()
+    yield
+    print(f"{label}: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+def percentiles(samples: list[float]) -> str:
+    samples = sorted(samples)
+    def pick(p):
+        return samples[min(len(samples) - 1, int(len(samples) * p))] * 1000
+    return f"p50={pick(0.50):.1f}ms p90={pick(0.90):.1f}ms p99={pick(0.99):.1f}ms mean={statistics.mean(samples) * 1000:.1f}ms"
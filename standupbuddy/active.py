@@ -0,0 +1,99 @@
+import time
+
+from .config import ACTIVE_MAX_PER_USER, ACTIVE_TTL_SEC
+
+
+class ActiveIndex:
+    """In-memory map of open standups waiting for each user's answer.
+
+    uid -> {standup_id: (update_id, {(chat_id, message_id), ...})}, the
+    prompt and reminder messages sent for it. Filled when a standup starts
+    and as its messages are sent, cleared on answer, on summary or after
+    ACTIVE_TTL_SEC; rebuilt from the database on startup. Only exact replies
+    to those messages are resolved here; SQLite stays the source of truth and
+    anything else falls back to a query.
+    """
+
+    def __init__(self, max_per_user: int = ACTIVE_MAX_PER_USER, ttl: float = ACTIVE_TTL_SEC):
+        self.max_per_user = max_per_user
+        self.ttl = ttl
+        self._by_user: dict[int, dict[int, tuple[int, set[tuple[int, int]]]]] = {}
+        self._members: dict[int, list[int]] = {}
+        # Insertion-ordered, so the oldest standups are at the front.
+        self._started: dict[int, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._started)
+
+    def add(self, standup_id: int, members, started: float | None = None) -> None:
+        """Register a standup's `(update_id, uid)` pairs."""
+        self._expire()
+        self._started[standup_id] = started if started is not None else time.monotonic()
+        self._members[standup_id] = [uid for _, uid in members]
+        for update_id, uid in members:
+            self._put(uid, standup_id, update_id)
+
+    def _put(self, uid: int, standup_id: int, update_id: int) -> set[tuple[int, int]]:
+        entries = self._by_user.setdefault(uid, {})
+        if standup_id not in entries:
+            entries[standup_id] = (update_id, set())
+            if len(entries) > self.max_per_user:
+                del entries[min(entries)]
+        return entries.get(standup_id, (None, set()))[1]
+
+    def set_prompts(self, rows) -> None:
+        """Attach sent prompts and reminders: `(chat_id, message_id, update_id)`; chat ids are user ids."""
+        for chat_id, message_id, update_id in rows:
+            for known_update, messages in self._by_user.get(chat_id, {}).values():
+                if known_update == update_id:
+                    messages.add((chat_id, message_id))
+                    break
+
+    def match(self, uid: int, chat_id: int, reply_to: int | None) -> tuple[int, int] | None:
+        """(standup_id, update_id) whose prompt or reminder is the message `reply_to` in `chat_id`."""
+        if reply_to is None:
+            return None
+        for standup_id, (update_id, messages) in self._by_user.get(uid, {}).items():
+            if (chat_id, reply_to) in messages:
+                return standup_id, update_id
+        return None
+
+    def discard(self, uid: int, standup_id: int) -> None:
+        entries = self._by_user.get(uid)
+        if entries is not None:
+            entries.pop(standup_id, None)
+            if not entries:
+                del self._by_user[uid]
+
+    def close(self, standup_id: int) -> None:
+        self._started.pop(standup_id, None)
+        for uid in self._members.pop(standup_id, ()):
+            self.discard(uid, standup_id)
+
+    def _expire(self) -> None:
+        cutoff = time.monotonic() - self.ttl
+        while self._started:
+            standup_id, started = next(iter(self._started.items()))
+            if started > cutoff:
+                break
+            self.close(standup_id)
+
+    def load(self, rows) -> None:
+        """Rebuild from `(standup_id, update_id, tg_id, chat_id, message_id, age_sec)` rows, one per sent message."""
+        self._by_user.clear()
+        self._members.clear()
+        self._started.clear()
+        now = time.monotonic()
+        for standup_id, update_id, uid, chat_id, message_id, age in rows:
+            if standup_id not in self._started:
+                self._started[standup_id] = now - age
+                self._members[standup_id] = []
+            if uid not in self._by_user or standup_id not in self._by_user[uid]:
+                self._members[standup_id].append(uid)
+            messages = self._put(uid, standup_id, update_id)
+            if message_id is not None:
+                messages.add((chat_id, message_id))
+        self._expire()
+
+
+index = ActiveIndex()
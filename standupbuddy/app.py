@@ -4,11 +4,13 @@ from telegram.ext import (
     CallbackQueryHandler, ConversationHandler, filters
 )
 
-from .config import BOT_TOKEN
+from .config import BOT_TOKEN, TELEGRAM_API_URL
+from .outbound import OutboundScheduler
+from .persistence import SQLitePersistence
 from .handlers import (
     cmd_start, cmd_help, cmd_health,
     on_menu_click, on_group_menu, on_settime_hhmm, on_tz_offset_pick,
-    on_settime_tz_manual, on_schedule_pick, on_remove_member, on_text_flow,
+    on_settime_tz_manual, on_schedule_pick, on_remove_member, on_team_search, on_text_flow,
     on_error,
 )
 from .states import (
@@ -18,7 +20,16 @@ from .states import (
 
 
 def build_app() -> Application:
-    app: Application = ApplicationBuilder().token(BOT_TOKEN).concurrent_updates(True).build()
+    builder = (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(True)
+        .rate_limiter(OutboundScheduler())
+        .persistence(SQLitePersistence())
+    )
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(TELEGRAM_API_URL)
+    app: Application = builder.build()
 
     conv = ConversationHandler(
         entry_points=[
@@ -28,7 +39,11 @@ def build_app() -> Application:
         ],
         states={
             S_MENU: [CallbackQueryHandler(on_menu_click)],
-            S_GROUP_SELECT: [CallbackQueryHandler(on_menu_click)],
+            S_GROUP_SELECT: [
+                CallbackQueryHandler(on_menu_click),
+                # Typing in the picker searches by name; replies are standup answers.
+                MessageHandler(filters.TEXT & (~filters.COMMAND) & (~filters.REPLY), on_team_search),
+            ],
             S_GROUP_MENU: [CallbackQueryHandler(on_group_menu)],
             S_CREATE_TEAM_NAME: [
                 MessageHandler(filters.TEXT & (~filters.COMMAND), on_text_flow),
@@ -58,6 +73,8 @@ def build_app() -> Application:
             CommandHandler("help", cmd_help),
         ],
         allow_reentry=True,
+        name="main",
+        persistent=True,
     )
 
     app.add_handler(conv)
@@ -0,0 +1,65 @@
+import threading
+from collections import OrderedDict
+
+from .config import TEAM_CACHE_SIZE, TEAM_LIST_CACHE_SIZE
+
+
+class LRUCache:
+    """Bounded least-recently-used map, safe to share with the DB executor threads.
+
+    Loaders read `generation` before querying and pass it to `put()`; a put
+    is dropped if anything was invalidated in between, so a slow read can
+    never store data older than a write that already invalidated the key.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, generation: int | None = None) -> None:
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, *keys) -> None:
+        with self._lock:
+            self.generation += 1
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+# team_id -> (row dict, manager ids, member ids), read through by repo.get_team().
+team_cache = LRUCache(TEAM_CACHE_SIZE)
+# uid -> [(team_id, name)] ordered by team id, for the team picker.
+team_lists = LRUCache(TEAM_LIST_CACHE_SIZE)
@@ -0,0 +1,86 @@
+import re
+from typing import NamedTuple
+
+from telegram.constants import InlineKeyboardButtonLimit
+
+
+class Callback(NamedTuple):
+    """Parsed callback data.
+
+    `gm:info:42` -> ("gm", "info", (42,)), `rm:.16:.1x3a9` -> ("rm", "", (42, 3223521)),
+    `sch:custom:toggle:3` -> ("sch", "custom:toggle", (3,)). The trailing
+    integer tokens are the args, decimal or base36 after a "." for the
+    compact form; the tokens between the prefix and them are the action.
+    """
+    prefix: str
+    action: str = ""
+    args: tuple[int, ...] = ()
+
+    @property
+    def key(self) -> tuple[str, str]:
+        return self.prefix, self.action
+
+
+# ASCII only: str.isdigit() also accepts digits such as "²" that int() rejects.
+_DECIMAL = re.compile(r"-?[0-9]+")
+_BASE36 = re.compile(r"\.-?[0-9a-z]+")
+
+
+def _to_base36(n: int) -> str:
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    sign, n = ("-", -n) if n < 0 else ("", n)
+    out = ""
+    while True:
+        n, r = divmod(n, 36)
+        out = digits[r] + out
+        if not n:
+            return "." + sign + out
+
+
+def _parse_int(token: str) -> int | None:
+    if _DECIMAL.fullmatch(token):
+        return int(token)
+    if _BASE36.fullmatch(token):
+        return int(token[1:], 36)
+    return None
+
+
+def encode(prefix: str, action: str = "", *args: int, compact: bool = False) -> str:
+    """`prefix[:action]:arg...`; `compact` writes the ints in base36 to save bytes."""
+    parts = [prefix]
+    if action:
+        parts.append(action)
+    parts.extend(_to_base36(a) if compact else str(a) for a in args)
+    data = ":".join(parts)
+    if len(data.encode()) > InlineKeyboardButtonLimit.MAX_CALLBACK_DATA:
+        raise ValueError(f"callback data too long: {data!r}")
+    return data
+
+
+def decode(data: str | None) -> Callback:
+    # encode() puts the ints last: only the trailing tokens are parsed.
+    parts = (data or "").split(":")
+    end, args = len(parts), []
+    while end > 1:
+        value = _parse_int(parts[end - 1])
+        if value is None:
+            break
+        args.append(value)
+        end -= 1
+    return Callback(parts[0], ":".join(parts[1:end]), tuple(reversed(args)))
+
+
+class Router:
+    """Dispatch table from a callback's (prefix, action) to its handler."""
+
+    def __init__(self):
+        self.routes: dict[tuple[str, str], object] = {}
+
+    def on(self, prefix: str, action: str = ""):
+        def register(fn):
+            self.routes[(prefix, action)] = fn
+            return fn
+        return register
+
+    def get(self, cb: Callback):
+        return self.routes.get(cb.key)
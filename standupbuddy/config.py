@@ -1,9 +1,65 @@
 import os
 
-DB_PATH = "dailybot.db"
+DB_PATH = os.getenv("DB_PATH", "dailybot.db")
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+PORT = int(os.getenv("PORT", 8080))
+
+# On SIGTERM/SIGINT, in-flight standups and sends get this long to finish.
+SHUTDOWN_DRAIN_SEC = float(os.getenv("SHUTDOWN_DRAIN_SEC", 20))
+
+# Webhook mode: set WEBHOOK_URL to the public https address of this server and
+# Telegram pushes updates to WEBHOOK_URL + WEBHOOK_PATH; unset means polling.
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+# Bot API base, e.g. a local stand-in for testing: http://127.0.0.1:8081/bot
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
 
 REMIND_AFTER_MIN = 10
 SUMMARY_AFTER_MIN = 20
+# Scheduled runs missed by at most this much while the bot was down start on boot.
+STARTUP_CATCHUP_MIN = 60
+# In-memory index of open standups: entries kept per user, and how long a
+# standup whose summary never ran stays indexed.
+ACTIVE_MAX_PER_USER = 32
+ACTIVE_TTL_SEC = (SUMMARY_AFTER_MIN + 60) * 60
+
+# Team picker: teams per page, and users whose team lists are kept in memory.
+TEAM_PAGE_SIZE = 8
+TEAM_LIST_CACHE_SIZE = 10_000
+# Teams (row, managers, member ids) kept in memory for the menu handlers.
+TEAM_CACHE_SIZE = 2000
+
+# Conversation states and user_data changed since the last round are written
+# to SQLite this often (and on shutdown).
+PERSISTENCE_INTERVAL_SEC = 10
+
+DB_POOL_SIZE = 8
+DB_POOL_TIMEOUT_SEC = 5.0
+
+# Telegram allows ~30 messages/s overall and ~1 message/s to the same chat.
+SEND_RATE_PER_SEC = 30
+SEND_RATE_PER_CHAT_PER_SEC = 1
+SEND_MAX_RETRIES = 3
+FANOUT_CONCURRENCY = 20
+# Per priority class; a full queue makes new sends of that class wait.
+OUTBOUND_QUEUE_SIZE = 500
+INTERACTIVE_QUEUE_SIZE = 5000
 
+# Durable outbox: rows claimed per batch, batches in flight (of which some are
+# kept for prompts and interactive replies, so bulk summaries cannot hold them
+# all), retry policy.
+OUTBOX_BATCH_SIZE = 200
+OUTBOX_MAX_BATCHES = 8
+OUTBOX_RESERVED_BATCHES = 2
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_BACKOFF_BASE_SEC = 5
+OUTBOX_BACKOFF_MAX_SEC = 600
+OUTBOX_IDLE_POLL_SEC = 30
 
+# Reminder/summary timers: fired per batch, handlers running at once, and how
+# long a failed timer waits before it is fired again.
+TIMER_BATCH_SIZE = 100
+TIMER_CONCURRENCY = 8
+TIMER_RETRY_SEC = 60
+TIMER_IDLE_POLL_SEC = 30
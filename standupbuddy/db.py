@@ -1,50 +1,117 @@
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
 
-from .config import DB_PATH
+from .config import DB_PATH, DB_POOL_SIZE, DB_POOL_TIMEOUT_SEC
+from .migrations import migrate
 
 
-def db() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+# Applied once when a connection is opened, not on every checkout.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+)
+
+
+class PoolExhausted(RuntimeError):
+    pass
+
+
+class ConnectionPool:
+    """Bounded pool of long-lived SQLite connections.
+
+    Connections are opened lazily up to `size`, handed out with `connection()`
+    and returned to the pool when the block exits.
+    """
+
+    def __init__(self, path: str, size: int, timeout: float):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._idle: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._live = 0
+        self._in_use = 0
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                grow = self._live < self.size
+                if grow:
+                    self._live += 1
+            if grow:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._lock:
+                        self._live -= 1
+                    raise
+            else:
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise PoolExhausted(f"no free DB connection after {self.timeout}s ({self.size} in use)") from None
+        with self._lock:
+            self._in_use += 1
+        return conn
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            self._in_use -= 1
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self) -> None:
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._live -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"live": self._live, "in_use": self._in_use, "size": self.size}
+
+
+pool = ConnectionPool(DB_PATH, DB_POOL_SIZE, DB_POOL_TIMEOUT_SEC)
+
+
+def connection():
+    return pool.connection()
 
 
 def init_db() -> None:
-    conn = db()
-    cur = conn.cursor()
-    cur.executescript(
-        """
-        PRAGMA journal_mode=WAL;
-        CREATE TABLE IF NOT EXISTS users (tg_id INTEGER PRIMARY KEY, name TEXT NOT NULL);
-        CREATE TABLE IF NOT EXISTS teams (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            invite_code TEXT UNIQUE NOT NULL,
-            tz TEXT NOT NULL DEFAULT 'UTC',
-            reminder_time TEXT,
-            reminder_days TEXT,
-            managers_json TEXT NOT NULL
-        );
-        CREATE TABLE IF NOT EXISTS team_members (team_id INTEGER NOT NULL, tg_id INTEGER NOT NULL, UNIQUE(team_id, tg_id));
-        CREATE TABLE IF NOT EXISTS standups (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            team_id INTEGER NOT NULL,
-            date_iso TEXT NOT NULL,
-            started_utc TEXT NOT NULL,
-            remind_job_key TEXT,
-            summary_job_key TEXT
-        );
-        CREATE TABLE IF NOT EXISTS updates (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            standup_id INTEGER NOT NULL,
-            tg_id INTEGER NOT NULL,
-            text TEXT,
-            created_utc TEXT,
-            answered INTEGER NOT NULL DEFAULT 0
-        );
-        """
-    )
-    conn.commit()
-    conn.close()
+    with connection() as conn:
+        migrate(conn)
 
 
+def close_db() -> None:
+    """Fold the WAL back into the database file and close the pooled connections."""
+    with connection() as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    pool.close()
@@ -0,0 +1,83 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+
+from . import metrics
+from .config import FANOUT_CONCURRENCY
+from .outbound import Dropped, Priority
+
+
+@dataclass
+class FanOutResult:
+    label: str
+    total: int
+    elapsed: float
+    # One entry per message, in input order: the sent Message or the exception.
+    results: list = field(repr=False)
+
+    @property
+    def sent(self) -> int:
+        return sum(1 for r in self.results if not isinstance(r, Exception))
+
+    @property
+    def dropped(self) -> int:
+        return sum(1 for r in self.results if isinstance(r, Dropped))
+
+    @property
+    def failed(self) -> int:
+        return self.total - self.sent - self.dropped
+
+    @property
+    def rate(self) -> float:
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+
+async def fan_out(
+    bot,
+    messages: list[dict],
+    label: str,
+    priority: Priority,
+    ttls: list[float | None] | None = None,
+    merge_keys: list | None = None,
+    concurrency: int = FANOUT_CONCURRENCY,
+    on_sent=None,
+) -> FanOutResult:
+    """Send `bot.send_message(**kwargs)` for each entry with bounded concurrency.
+
+    Pacing and ordering against other traffic is left to the bot's
+    OutboundScheduler; `priority` and the optional per-message `ttls` and
+    `merge_keys` are passed to it. Failures are collected, not raised.
+    `on_sent(i, message)` is called as each send succeeds, before the rest
+    of the batch is done.
+    """
+    results: list = [None] * len(messages)
+    pending = iter(range(len(messages)))
+
+    async def worker():
+        for i in pending:
+            rl = {"priority": priority}
+            if ttls and ttls[i] is not None:
+                rl["ttl"] = ttls[i]
+            if merge_keys and merge_keys[i] is not None:
+                rl["merge_key"] = merge_keys[i]
+            try:
+                results[i] = await bot.send_message(**messages[i], rate_limit_args=rl)
+            except Exception as e:
+                results[i] = e
+                continue
+            if on_sent:
+                on_sent(i, results[i])
+
+    start = time.monotonic()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, len(messages)))))
+    result = FanOutResult(label, len(messages), time.monotonic() - start, results)
+    metrics.incr("messages_sent", result.sent)
+    metrics.incr("messages_failed", result.failed)
+    metrics.incr("messages_dropped", result.dropped)
+    metrics.recent_fanouts.append((label, result.sent, result.failed, round(result.elapsed, 2)))
+    if messages:
+        print(
+            f"fan-out {label}: {result.sent}/{result.total} sent, {result.failed} failed, "
+            f"{result.dropped} dropped in {result.elapsed:.2f}s ({result.rate:.1f} msg/s)"
+        )
+    return result
@@ -1,22 +1,32 @@
 import asyncio
 import json
+from datetime import datetime
 
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.constants import ParseMode
 from telegram.ext import ContextTypes, ConversationHandler
 
-from .db import db
+from . import metrics, repo
+from .active import index as active
+from .cache import team_cache, team_lists
+from .callbacks import Router, decode, encode
+from .config import TEAM_PAGE_SIZE
+from .db import pool
 from .keyboards import (
+    BACK_TO_GROUP,
     main_menu,
     group_menu_keyboard,
     cancel_kb_to_menu,
     cancel_kb_to_group,
     team_choice_keyboard,
+    user_team_list,
     tz_offset_keyboard,
     schedule_preset_keyboard,
     schedule_custom_keyboard,
+    days_mask,
+    mask_days,
 )
-from .jobs import reschedule_daily_job, start_standup
+from .jobs import reschedule_daily_job, scheduler, start_standup
 from .states import (
     S_MENU,
     S_CREATE_TEAM_NAME,
@@ -28,7 +38,7 @@ from .states import (
     S_SET_SCHEDULE,
     S_REMOVE_MEMBER_SELECT,
 )
-from .utils import get_user_name, parse_hhmm, tz_from_str, today_in_tz, now_utc, gen_invite_code, days_to_label, parse_reminder_days, compute_next_run_local
+from .utils import get_user_name, parse_hhmm, parse_tz, tz_from_str, gen_invite_code, days_to_label, parse_reminder_days
 
 
 async def show_main_menu(update: Update, ctx: ContextTypes.DEFAULT_TYPE, text: str | None = None):
@@ -39,10 +49,30 @@ async def show_main_menu(update: Update, ctx: ContextTypes.DEFAULT_TYPE, text: s
         await update.effective_message.reply_text(msg, reply_markup=main_menu(update.effective_user.id))
 
 
+async def show_team_picker(update: Update, ctx: ContextTypes.DEFAULT_TYPE, text: str = "Выберите группу:",
+                           after: int = 0, before: int | None = None, prefix: str = ""):
+    """Show a page of the team picker; `prefix` is remembered for its page buttons."""
+    uid = update.effective_user.id
+    ctx.user_data["team_prefix"] = prefix
+    if not prefix and len(await user_team_list(uid)) > TEAM_PAGE_SIZE:
+        text += "\n\nЧтобы найти группу, напишите начало её названия."
+    kb = await team_choice_keyboard(uid, after, before, prefix)
+    if update.callback_query:
+        await update.callback_query.edit_message_text(text, reply_markup=kb)
+    else:
+        await update.effective_message.reply_text(text, reply_markup=kb)
+    return S_GROUP_SELECT
+
+
+async def on_team_search(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    prefix = (update.effective_message.text or "").strip()[:64]
+    if not prefix:
+        return await show_team_picker(update, ctx)
+    return await show_team_picker(update, ctx, f"Группы на «{prefix}»:", prefix=prefix)
+
+
 async def cmd_start(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    conn = db()
-    with conn:
-        conn.execute("INSERT OR REPLACE INTO users (tg_id, name) VALUES (?, ?)", (update.effective_user.id, get_user_name(update)))
+    await repo.upsert_user(update.effective_user.id, get_user_name(update))
     await show_main_menu(update, ctx)
     return S_MENU
 
@@ -54,166 +84,237 @@ async def cmd_help(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
 async def cmd_health(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     try:
-        conn = db(); conn.execute("SELECT 1"); ok_db = True
+        ok_db = await repo.ping()
+        outbox_depth = await repo.outbox_depth()
     except Exception:
         ok_db = False
-    await update.effective_message.reply_text(f"DB: {'OK' if ok_db else 'FAIL'} | Jobs: {len(ctx.application.job_queue.jobs())}")
+        outbox_depth = "?"
+    st = pool.stats()
+    counters = metrics.snapshot()
+    lines = [
+        f"DB: {'OK' if ok_db else 'FAIL'} | Jobs: {len(ctx.application.job_queue.jobs())} | "
+        f"Scheduled teams: {len(scheduler)} | "
+        f"Connections: {st['live']}/{st['size']} (in use {st['in_use']})",
+        f"Sent: {counters.get('messages_sent', 0)} | Failed: {counters.get('messages_failed', 0)} | "
+        f"Flood waits: {counters.get('retry_after', 0)} | Outbox: {outbox_depth} pending, "
+        f"{counters.get('outbox_retried', 0)} retried, {counters.get('outbox_dead', 0)} given up | "
+        f"Unreachable users: {counters.get('users_blocked', 0)}",
+    ]
+    for label, cache in (("Team cache", team_cache), ("Team lists", team_lists)):
+        c = cache.stats()
+        lines.append(f"{label}: {c['size']}/{c['maxsize']}, {c['hits']} hits / {c['misses']} misses")
+    outbound = ctx.application.bot.rate_limiter
+    if outbound:
+        lines.append("Queues: " + " ".join(f"{k}={v}" for k, v in outbound.depths().items()))
+    if metrics.recent_fanouts:
+        label, sent, failed, elapsed = metrics.recent_fanouts[-1]
+        lines.append(f"Last fan-out: {label}, {sent} sent / {failed} failed in {elapsed}s")
+    await update.effective_message.reply_text("\n".join(lines))
     return S_MENU
 
 
+menu = Router()
+
+
 async def on_menu_click(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query; await q.answer(); data = q.data
-    if data == "m:create":
-        ctx.user_data["await_create_team_name"] = True
-        await q.edit_message_text("Название новой команды? Напишите текстом.", reply_markup=cancel_kb_to_menu())
-        return S_CREATE_TEAM_NAME
-    if data in ("m:teams", "back:teams"):
-        await q.edit_message_text("Выберите группу:", reply_markup=team_choice_keyboard(update.effective_user.id))
-        return S_GROUP_SELECT
-    if data.startswith("g:"):
-        team_id = int(data.split(":",1)[1])
-        conn = db()
-        team = conn.execute("SELECT id, name, tz, reminder_time, reminder_days, managers_json FROM teams WHERE id=?", (team_id,)).fetchone()
-        if not team:
-            await q.edit_message_text("Команда не найдена.", reply_markup=team_choice_keyboard(update.effective_user.id))
-            return S_GROUP_SELECT
-        ctx.user_data["group_id"] = team_id
-        is_mgr = update.effective_user.id in json.loads(team["managers_json"])
-        await q.edit_message_text(f"Команда «{team['name']}» (ID {team_id})", reply_markup=group_menu_keyboard(team, is_mgr, update.effective_user.id))
-        return S_GROUP_MENU
-    if data == "m:join":
-        ctx.user_data["await_join_code"] = True
-        await q.edit_message_text("Введи инвайт‑код:", reply_markup=cancel_kb_to_menu())
-        return S_JOIN_CODE
-    if data == "back:menu":
-        await show_main_menu(update, ctx); return S_MENU
-    return S_MENU
+    q = update.callback_query; await q.answer()
+    cb = decode(q.data)
+    handler = menu.get(cb)
+    if handler is None:
+        return S_MENU
+    return await handler(update, ctx, cb)
+
+
+@menu.on("m", "create")
+async def _menu_create(update, ctx, cb):
+    ctx.user_data["await_create_team_name"] = True
+    await update.callback_query.edit_message_text("Название новой команды? Напишите текстом.", reply_markup=cancel_kb_to_menu())
+    return S_CREATE_TEAM_NAME
+
+
+@menu.on("m", "teams")
+@menu.on("back", "teams")
+@menu.on("tl", "all")
+async def _menu_teams(update, ctx, cb):
+    return await show_team_picker(update, ctx)
+
+
+# Team picker pages: tl:n:<last id shown>, tl:p:<first id shown>.
+@menu.on("tl", "n")
+@menu.on("tl", "p")
+async def _menu_team_page(update, ctx, cb):
+    if not cb.args:
+        return await show_team_picker(update, ctx)
+    prefix = ctx.user_data.get("team_prefix", "")
+    text = f"Группы на «{prefix}»:" if prefix else "Выберите группу:"
+    if cb.action == "n":
+        return await show_team_picker(update, ctx, text, after=cb.args[0], prefix=prefix)
+    return await show_team_picker(update, ctx, text, before=cb.args[0], prefix=prefix)
+
+
+@menu.on("g")
+async def _menu_pick_team(update, ctx, cb):
+    team = await repo.get_team(cb.args[0], update.effective_user.id) if cb.args else None
+    if not team or not team["is_member"]:
+        return await show_team_picker(update, ctx, "Команда не найдена.")
+    ctx.user_data["group_id"] = team["id"]
+    await update.callback_query.edit_message_text(f"Команда «{team['name']}» (ID {team['id']})", reply_markup=group_menu_keyboard(team, team["is_manager"], update.effective_user.id))
+    return S_GROUP_MENU
+
+
+@menu.on("m", "join")
+async def _menu_join(update, ctx, cb):
+    ctx.user_data["await_join_code"] = True
+    await update.callback_query.edit_message_text("Введи инвайт‑код:", reply_markup=cancel_kb_to_menu())
+    return S_JOIN_CODE
+
+
+@menu.on("back", "menu")
+async def _menu_back(update, ctx, cb):
+    await show_main_menu(update, ctx); return S_MENU
+
+
+group = Router()
 
 
 async def on_group_menu(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query; await q.answer(); data = q.data
-    team_id = ctx.user_data.get("group_id")
+    q = update.callback_query; await q.answer()
+    cb = decode(q.data)
+    if cb.key == ("back", "teams"):
+        return await show_team_picker(update, ctx)
+    if cb.key == ("back", "menu"):
+        await show_main_menu(update, ctx); return S_MENU
+    # gm:<action>:<team_id> acts on the team on the button, which may not be
+    # the last one opened (an older menu message, another chat).
+    team_id = cb.args[0] if cb.prefix == "gm" and cb.args else ctx.user_data.get("group_id")
     if not team_id:
         await show_main_menu(update, ctx, "Группа не выбрана."); return S_MENU
-    conn = db()
-    team = conn.execute("SELECT id, name, tz, reminder_time, reminder_days, managers_json, invite_code FROM teams WHERE id=?", (team_id,)).fetchone()
-    if not team:
-        await q.edit_message_text("Команда не найдена.", reply_markup=team_choice_keyboard(update.effective_user.id)); return S_GROUP_SELECT
-    managers = json.loads(team["managers_json"]); is_mgr = update.effective_user.id in managers
-
-    if data == "back:group":
-        await q.edit_message_text(f"Команда «{team['name']}» (ID {team_id})", reply_markup=group_menu_keyboard(team, is_mgr, update.effective_user.id)); return S_GROUP_MENU
-
-    if data == f"gm:info:{team_id}":
-        members = conn.execute("SELECT u.tg_id, u.name FROM team_members tm JOIN users u ON u.tg_id=tm.tg_id WHERE tm.team_id=? ORDER BY u.name COLLATE NOCASE", (team_id,)).fetchall()
-        next_run_dt = compute_next_run_local(team["reminder_time"], team["tz"], team["reminder_days"]) if team["reminder_time"] else None
-        next_run_label = next_run_dt.strftime("%Y-%m-%d %H:%M") + f" {team['tz']}" if next_run_dt else "—"
-        lines = [
-            f"Название: {team['name']}",
-            f"ID: {team_id}",
-            f"Код для вступления: {team['invite_code']}",
-            f"TZ: {team['tz']}",
-            f"Участников: {len(members)}",
-            f"Следующий запуск: {next_run_label}",
-            "",
-        ]
-        for m in members:
-            mark = " (менеджер)" if m["tg_id"] in managers else ""
-            lines.append(f"• {m['name']}{mark}")
-        await q.edit_message_text("\n".join(lines), reply_markup=group_menu_keyboard(team, is_mgr, update.effective_user.id)); return S_GROUP_MENU
-
-    if data == f"gm:view:{team_id}":
-        if team["reminder_time"]:
-            label = days_to_label(parse_reminder_days(team["reminder_days"]))
-            print(f"DEBUG: Viewing schedule - raw_days: {team['reminder_days']}, parsed: {parse_reminder_days(team['reminder_days'])}, label: {label}")
-            txt = f"✅ Расписание:\nВремя: {team['reminder_time']}\nTZ: {team['tz']}\nДни: {label}"
-        else:
-            txt = "Расписание ещё не создано."
-        await q.edit_message_text(txt, reply_markup=group_menu_keyboard(team, is_mgr, update.effective_user.id)); return S_GROUP_MENU
-
-    if data == f"gm:edit:{team_id}":
-        if not is_mgr:
-            await q.edit_message_text("Только менеджер может менять расписание.", reply_markup=group_menu_keyboard(team, is_mgr, update.effective_user.id)); return S_GROUP_MENU
-        ctx.user_data["settime_hhmm"] = None
-        await q.edit_message_text("Введите время в формате HH:MM (например, 10:00)", reply_markup=cancel_kb_to_group())
-        return S_SET_TIME_HHMM
+    team = await repo.get_team(team_id, update.effective_user.id)
+    if not team or not team["is_member"]:
+        return await show_team_picker(update, ctx, "Команда не найдена.")
+    ctx.user_data["group_id"] = team_id
+    handler = group.get(cb)
+    if handler is None:
+        return S_GROUP_MENU
+    return await handler(update, ctx, team)
+
+
+async def _group_reply(update: Update, team, text: str):
+    await update.callback_query.edit_message_text(text, reply_markup=group_menu_keyboard(team, team["is_manager"], update.effective_user.id))
+    return S_GROUP_MENU
 
-    if data == f"gm:del:{team_id}":
-        if not is_mgr:
-            await q.edit_message_text("Только менеджер может удалять расписание.", reply_markup=group_menu_keyboard(team, is_mgr, update.effective_user.id)); return S_GROUP_MENU
-        with conn:
-            conn.execute("UPDATE teams SET reminder_time=NULL, reminder_days=NULL WHERE id=?", (team_id,))
-        from .jobs import remove_daily_job
-        await remove_daily_job(ctx.application, team_id)
-        team = conn.execute("SELECT id, name, tz, reminder_time, reminder_days, managers_json, invite_code FROM teams WHERE id=?", (team_id,)).fetchone()
-        await q.edit_message_text("✅ Расписание удалено. Дэйлики больше не планируются до создания нового расписания.", reply_markup=group_menu_keyboard(team, is_mgr, update.effective_user.id)); return S_GROUP_MENU
-
-    if data == f"gm:run:{team_id}":
-        if not is_mgr:
-            await q.edit_message_text("Только менеджер может запускать дэйлик вручную.", reply_markup=group_menu_keyboard(team, is_mgr, update.effective_user.id)); return S_GROUP_MENU
-        await start_standup(ctx.application, team_id, manual=True)
-        await q.edit_message_text("✅ Дэйлик запущен и отправлен всем участникам.", reply_markup=group_menu_keyboard(team, is_mgr, update.effective_user.id)); return S_GROUP_MENU
-
-    if data == f"gm:members:{team_id}":
-        members = conn.execute("SELECT u.tg_id, u.name FROM team_members tm JOIN users u ON u.tg_id=tm.tg_id WHERE tm.team_id=? ORDER BY u.name COLLATE NOCASE", (team_id,)).fetchall()
-        names = []
-        for m in members:
-            mark = " (менеджер)" if m["tg_id"] in managers else ""
-            names.append(f"• {m['name']}{mark}")
-        kb = InlineKeyboardMarkup([[InlineKeyboardButton("◀️ Назад", callback_data="back:group")]])
-        await q.edit_message_text("👥 Участники:\n" + ("\n".join(names) if names else "— никого"), reply_markup=kb); return S_GROUP_MENU
-
-    if data == f"gm:leave:{team_id}":
-        if is_mgr and len(managers) == 1 and managers[0] == update.effective_user.id:
-            await q.edit_message_text("Нельзя выйти: вы единственный менеджер. Назначьте другого менеджера и попробуйте снова.", reply_markup=group_menu_keyboard(team, is_mgr, update.effective_user.id)); return S_GROUP_MENU
-        with conn:
-            conn.execute("DELETE FROM team_members WHERE team_id=? AND tg_id=?", (team_id, update.effective_user.id))
-            if is_mgr:
-                managers = [m for m in managers if m != update.effective_user.id]
-                conn.execute("UPDATE teams SET managers_json=? WHERE id=?", (json.dumps(managers), team_id))
-        ctx.user_data.pop("group_id", None)
-        await q.edit_message_text("Вы вышли из группы.", reply_markup=team_choice_keyboard(update.effective_user.id)); return S_GROUP_SELECT
-
-    if data == f"gm:rmembers:{team_id}":
-        if not is_mgr:
-            await q.edit_message_text("Только менеджер может удалять участников.", reply_markup=group_menu_keyboard(team, is_mgr, update.effective_user.id)); return S_GROUP_MENU
-        members = conn.execute("SELECT u.tg_id, u.name FROM team_members tm JOIN users u ON u.tg_id=tm.tg_id WHERE tm.team_id=? ORDER BY u.name COLLATE NOCASE", (team_id,)).fetchall()
-        btns = []
-        for m in members:
-            if m["tg_id"] == update.effective_user.id:
-                continue
-            btns.append([InlineKeyboardButton(f"Удалить {m['name']}", callback_data=f"rm:{team_id}:{m['tg_id']}")])
-        btns.append([InlineKeyboardButton("◀️ Назад", callback_data="back:group")])
-        await q.edit_message_text("Кого удалить?", reply_markup=InlineKeyboardMarkup(btns)); return S_REMOVE_MEMBER_SELECT
-
-    if data == "back:teams":
-        await q.edit_message_text("Выберите группу:", reply_markup=team_choice_keyboard(update.effective_user.id)); return S_GROUP_SELECT
-
-    if data == "back:menu":
-        await show_main_menu(update, ctx); return S_MENU
 
+@group.on("back", "group")
+async def _group_back(update, ctx, team):
+    return await _group_reply(update, team, f"Команда «{team['name']}» (ID {team['id']})")
+
+
+@group.on("gm", "info")
+async def _group_info(update, ctx, team):
+    members = await repo.team_member_names(team["id"])
+    next_run = team["next_run_utc"]
+    next_run_label = datetime.fromisoformat(next_run).astimezone(tz_from_str(team["tz"])).strftime("%Y-%m-%d %H:%M") + f" {team['tz']}" if next_run else "—"
+    lines = [
+        f"Название: {team['name']}",
+        f"ID: {team['id']}",
+        f"Код для вступления: {team['invite_code']}",
+        f"TZ: {team['tz']}",
+        f"Участников: {len(members)}",
+        f"Следующий запуск: {next_run_label}",
+        "",
+    ]
+    for m in members:
+        mark = " (менеджер)" if m["is_manager"] else ""
+        lines.append(f"• {m['name']}{mark}")
+    return await _group_reply(update, team, "\n".join(lines))
+
+
+@group.on("gm", "view")
+async def _group_view(update, ctx, team):
+    if team["reminder_time"]:
+        label = days_to_label(parse_reminder_days(team["reminder_days"]))
+        print(f"DEBUG: Viewing schedule - raw_days: {team['reminder_days']}, parsed: {parse_reminder_days(team['reminder_days'])}, label: {label}")
+        txt = f"✅ Расписание:\nВремя: {team['reminder_time']}\nTZ: {team['tz']}\nДни: {label}"
+    else:
+        txt = "Расписание ещё не создано."
+    return await _group_reply(update, team, txt)
+
+
+@group.on("gm", "edit")
+async def _group_edit(update, ctx, team):
+    if not team["is_manager"]:
+        return await _group_reply(update, team, "Только менеджер может менять расписание.")
+    ctx.user_data["settime_hhmm"] = None
+    await update.callback_query.edit_message_text("Введите время в формате HH:MM (например, 10:00)", reply_markup=cancel_kb_to_group())
+    return S_SET_TIME_HHMM
+
+
+@group.on("gm", "del")
+async def _group_delete_schedule(update, ctx, team):
+    if not team["is_manager"]:
+        return await _group_reply(update, team, "Только менеджер может удалять расписание.")
+    team = await repo.clear_schedule(team["id"], update.effective_user.id)
+    from .jobs import remove_daily_job
+    await remove_daily_job(ctx.application, team["id"])
+    return await _group_reply(update, team, "✅ Расписание удалено. Дэйлики больше не планируются до создания нового расписания.")
+
+
+@group.on("gm", "run")
+async def _group_run(update, ctx, team):
+    if not team["is_manager"]:
+        return await _group_reply(update, team, "Только менеджер может запускать дэйлик вручную.")
+    await start_standup(ctx.application, team["id"], manual=True)
+    return await _group_reply(update, team, "✅ Дэйлик запущен и отправлен всем участникам.")
+
+
+@group.on("gm", "members")
+async def _group_members(update, ctx, team):
+    members = await repo.team_member_names(team["id"])
+    names = []
+    for m in members:
+        mark = " (менеджер)" if m["is_manager"] else ""
+        names.append(f"• {m['name']}{mark}")
+    await update.callback_query.edit_message_text("👥 Участники:\n" + ("\n".join(names) if names else "— никого"), reply_markup=BACK_TO_GROUP)
     return S_GROUP_MENU
 
 
+@group.on("gm", "leave")
+async def _group_leave(update, ctx, team):
+    if not await repo.remove_member(team["id"], update.effective_user.id):
+        return await _group_reply(update, team, "Нельзя выйти: вы единственный менеджер. Назначьте другого менеджера и попробуйте снова.")
+    ctx.user_data.pop("group_id", None)
+    return await show_team_picker(update, ctx, "Вы вышли из группы.")
+
+
+@group.on("gm", "rmembers")
+async def _group_remove_members(update, ctx, team):
+    if not team["is_manager"]:
+        return await _group_reply(update, team, "Только менеджер может удалять участников.")
+    members = await repo.team_member_names(team["id"])
+    btns = []
+    for m in members:
+        if m["tg_id"] == update.effective_user.id:
+            continue
+        btns.append([InlineKeyboardButton(f"Удалить {m['name']}", callback_data=encode("rm", "", team["id"], m["tg_id"], compact=True))])
+    btns.append([InlineKeyboardButton("◀️ Назад", callback_data=encode("back", "group"))])
+    await update.callback_query.edit_message_text("Кого удалить?", reply_markup=InlineKeyboardMarkup(btns))
+    return S_REMOVE_MEMBER_SELECT
+
+
 async def on_remove_member(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query; await q.answer(); data = q.data
-    if data == "back:group":
+    q = update.callback_query; await q.answer()
+    cb = decode(q.data)
+    if cb.key == ("back", "group"):
         return await on_group_menu(update, ctx)
-    if not data.startswith("rm:"):
+    if cb.key != ("rm", "") or len(cb.args) != 2:
         return S_REMOVE_MEMBER_SELECT
-    _, team_id_s, user_id_s = data.split(":")
-    team_id = int(team_id_s); user_id = int(user_id_s)
-    conn = db()
-    team = conn.execute("SELECT managers_json, name FROM teams WHERE id= ?", (team_id,)).fetchone()
-    managers = json.loads(team["managers_json"]) if team else []
-    if user_id in managers and len(managers) == 1:
-        await q.edit_message_text("Нельзя удалить единственного менеджера.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("◀️ Назад", callback_data="back:group")]])); return S_GROUP_MENU
-    with conn:
-        conn.execute("DELETE FROM team_members WHERE team_id=? AND tg_id=?", (team_id, user_id))
-        if user_id in managers:
-            managers = [m for m in managers if m != user_id]
-            conn.execute("UPDATE teams SET managers_json=? WHERE id=?", (json.dumps(managers), team_id))
-    await q.edit_message_text("Участник удалён.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("◀️ Назад", callback_data="back:group")]])); return S_GROUP_MENU
+    team_id, user_id = cb.args
+    team = await repo.get_team(team_id, update.effective_user.id)
+    if not team or not team["is_manager"]:
+        await q.edit_message_text("Только менеджер может удалять участников.", reply_markup=BACK_TO_GROUP); return S_GROUP_MENU
+    if not await repo.remove_member(team_id, user_id):
+        await q.edit_message_text("Нельзя удалить единственного менеджера.", reply_markup=BACK_TO_GROUP); return S_GROUP_MENU
+    await q.edit_message_text("Участник удалён.", reply_markup=BACK_TO_GROUP); return S_GROUP_MENU
 
 
 async def on_settime_hhmm(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
@@ -229,90 +330,111 @@ async def on_settime_hhmm(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
 
 async def on_tz_offset_pick(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query; await q.answer(); data = q.data
-    if data.startswith("tzo:"):
-        off = int(data.split(":", 1)[1])
-        tz_name = f"UTC{off:+d}"
+    q = update.callback_query; await q.answer()
+    cb = decode(q.data)
+    if cb.prefix == "tzo" and cb.args:
+        tz_name = f"UTC{cb.args[0]:+d}"
         ctx.user_data["settime_tz"] = tz_name
         await q.edit_message_text(f"Часовой пояс: {tz_name}. Выберите расписание:", reply_markup=schedule_preset_keyboard()); return S_SET_SCHEDULE
-    if data == "back:group":
+    if cb.key == ("back", "group"):
         return await on_group_menu(update, ctx)
 
 
 async def on_settime_tz_manual(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     tz_name = (update.effective_message.text or "").strip()
     try:
-        _ = tz_from_str(tz_name)
-    except Exception:
-        await update.effective_message.reply_text("Не понял таймзону. Используй формат UTC+3 или выбери кнопку.", reply_markup=cancel_kb_to_group())
+        tz = parse_tz(tz_name)
+    except ValueError:
+        await update.effective_message.reply_text(
+            "Не понял таймзону. Используй формат UTC+3, UTC+5:30 или название вроде Europe/Moscow, либо выбери кнопку.",
+            reply_markup=cancel_kb_to_group(),
+        )
         return S_SET_TIME_TZ
-    ctx.user_data["settime_tz"] = tz_name
+    # Store the canonical spelling: "Europe/Moscow" for IANA names, "UTC+5:30" for offsets.
+    ctx.user_data["settime_tz"] = getattr(tz, "zone", None) or tz_name.upper()
     await update.effective_message.reply_text("Выберите расписание запусков:", reply_markup=schedule_preset_keyboard())
     return S_SET_SCHEDULE
 
 
+schedule = Router()
+PRESETS = {"everyday": tuple(range(7)), "weekdays": tuple(range(5)), "weekends": (5, 6)}
+
+
 async def on_schedule_pick(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query; await q.answer(); data = q.data
+    q = update.callback_query; await q.answer()
+    cb = decode(q.data)
     team_id = ctx.user_data.get("group_id")
     if not team_id:
         await show_main_menu(update, ctx, "Группа не выбрана."); return S_MENU
-
-    from .utils import parse_reminder_days
-
-    def finish_save(days: tuple[int, ...]):
-        hhmm = ctx.user_data.get("settime_hhmm")
-        tz_name = ctx.user_data.get("settime_tz")
-        uid = update.effective_user.id
-        if not hhmm or not tz_name:
-            return "Не хватает данных. Начните заново."
-        conn = db()
-        team = conn.execute("SELECT name, managers_json FROM teams WHERE id=?", (team_id,)).fetchone()
-        if not team:
-            return "Команда не найдена."
-        if uid not in json.loads(team["managers_json"]):
-            return "Только менеджер может менять расписание."
+    handler = schedule.get(cb)
+    if handler is None:
+        await q.edit_message_text("Выберите расписание:", reply_markup=schedule_preset_keyboard()); return S_SET_SCHEDULE
+    return await handler(update, ctx, cb, team_id)
+
+
+async def _save_schedule(update: Update, ctx: ContextTypes.DEFAULT_TYPE, team_id: int, days: tuple[int, ...]):
+    uid = update.effective_user.id
+    hhmm = ctx.user_data.get("settime_hhmm")
+    tz_name = ctx.user_data.get("settime_tz")
+    team = await repo.get_team(team_id, uid)
+    if not hhmm or not tz_name:
+        msg = "Не хватает данных. Начните заново."
+    elif not team:
+        msg = "Команда не найдена."
+    elif not team["is_manager"]:
+        msg = "Только менеджер может менять расписание."
+    else:
         days_json = json.dumps(list(days))
         print(f"DEBUG: Saving schedule - days: {days}, days_json: {days_json}, label: {days_to_label(days)}")
-        with conn:
-            conn.execute("UPDATE teams SET reminder_time=?, tz=?, reminder_days=? WHERE id=?", (hhmm, tz_name, days_json, team_id))
+        await repo.save_schedule(team_id, hhmm, tz_name, days_json)
         for k in ("settime_hhmm","settime_tz","settime_days"):
             ctx.user_data.pop(k, None)
         asyncio.create_task(reschedule_daily_job(ctx.application, team_id))
-        return f"Ок! Время дэйлика: {hhmm} ({tz_name}), дни: {days_to_label(days)}."
-
-    if data == "sch:preset:everyday":
-        msg = finish_save(tuple(range(7)))
-    elif data == "sch:preset:weekdays":
-        msg = finish_save(tuple(range(5)))
-    elif data == "sch:preset:weekends":
-        msg = finish_save((5, 6))
-    elif data.startswith("sch:custom"):
-        sel = set(ctx.user_data.get("settime_days", set()))
-        if data == "sch:custom:start":
-            if not sel: sel = set(range(5))
-            ctx.user_data["settime_days"] = sel
-            await q.edit_message_text("Отметьте дни недели:", reply_markup=schedule_custom_keyboard(sel)); return S_SET_SCHEDULE
-        if data == "sch:custom:reset":
-            ctx.user_data["settime_days"] = set()
-            await q.edit_message_text("Отметьте дни недели:", reply_markup=schedule_custom_keyboard(set())); return S_SET_SCHEDULE
-        if data == "sch:custom:save":
-            days = tuple(sorted(ctx.user_data.get("settime_days", set())))
-            if not days:
-                await q.edit_message_text("Нужно выбрать хотя бы один день.", reply_markup=schedule_custom_keyboard(set())); return S_SET_SCHEDULE
-            msg = finish_save(days)
-        if data.startswith("sch:custom:toggle:"):
-            d = int(data.rsplit(":", 1)[1])
-            if d in sel: sel.remove(d)
-            else: sel.add(d)
-            ctx.user_data["settime_days"] = sel
-            await q.edit_message_text("Отметьте дни недели:", reply_markup=schedule_custom_keyboard(sel)); return S_SET_SCHEDULE
-    else:
-        await q.edit_message_text("Выберите расписание:", reply_markup=schedule_preset_keyboard()); return S_SET_SCHEDULE
+        msg = f"Ок! Время дэйлика: {hhmm} ({tz_name}), дни: {days_to_label(days)}."
+        team = await repo.get_team(team_id, uid)
+    if not team:
+        await show_main_menu(update, ctx, msg); return S_MENU
+    await update.callback_query.edit_message_text(msg, reply_markup=group_menu_keyboard(team, team["is_manager"], uid))
+    return S_GROUP_MENU
 
-    conn = db()
-    team = conn.execute("SELECT id, name, tz, reminder_time, reminder_days, managers_json, invite_code FROM teams WHERE id=?", (team_id,)).fetchone()
-    is_mgr = update.effective_user.id in json.loads(team["managers_json"])
-    await q.edit_message_text(msg, reply_markup=group_menu_keyboard(team, is_mgr, update.effective_user.id)); return S_GROUP_MENU
+
+@schedule.on("sch", "preset:everyday")
+@schedule.on("sch", "preset:weekdays")
+@schedule.on("sch", "preset:weekends")
+async def _schedule_preset(update, ctx, cb, team_id):
+    return await _save_schedule(update, ctx, team_id, PRESETS[cb.action.split(":", 1)[1]])
+
+
+async def _show_days(update: Update, ctx: ContextTypes.DEFAULT_TYPE, mask: int, text: str = "Отметьте дни недели:"):
+    ctx.user_data["settime_days"] = mask
+    await update.callback_query.edit_message_text(text, reply_markup=schedule_custom_keyboard(mask))
+    return S_SET_SCHEDULE
+
+
+@schedule.on("sch", "custom:start")
+async def _schedule_custom_start(update, ctx, cb, team_id):
+    return await _show_days(update, ctx, ctx.user_data.get("settime_days") or days_mask(range(5)))
+
+
+@schedule.on("sch", "custom:reset")
+async def _schedule_custom_reset(update, ctx, cb, team_id):
+    return await _show_days(update, ctx, 0)
+
+
+@schedule.on("sch", "custom:toggle")
+async def _schedule_custom_toggle(update, ctx, cb, team_id):
+    mask = ctx.user_data.get("settime_days", 0)
+    if cb.args and 0 <= cb.args[0] < 7:
+        mask ^= 1 << cb.args[0]
+    return await _show_days(update, ctx, mask)
+
+
+@schedule.on("sch", "custom:save")
+async def _schedule_custom_save(update, ctx, cb, team_id):
+    days = mask_days(ctx.user_data.get("settime_days", 0))
+    if not days:
+        return await _show_days(update, ctx, 0, "Нужно выбрать хотя бы один день.")
+    return await _save_schedule(update, ctx, team_id, days)
 
 
 async def on_text_flow(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
@@ -320,56 +442,52 @@ async def on_text_flow(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         name = (update.effective_message.text or "").strip()
         code = gen_invite_code()
         manager_id = update.effective_user.id
-        conn = db()
-        with conn:
-            cur = conn.execute("INSERT INTO teams (name, invite_code, tz, reminder_time, reminder_days, managers_json) VALUES (?, ?, 'UTC', NULL, NULL, ?)", (name, code, json.dumps([manager_id])))
-            team_id = cur.lastrowid
-            conn.execute("INSERT OR IGNORE INTO team_members (team_id, tg_id) VALUES (?, ?)", (team_id, manager_id))
+        team_id = await repo.create_team(name, code, manager_id)
         ctx.user_data.pop("await_create_team_name", None)
-        await update.effective_message.reply_text(
-            f"Команда создана!\nID: {team_id}\nКод: {code}\nТеперь выбери группу, чтобы перейти в её настройки.",
-            reply_markup=team_choice_keyboard(update.effective_user.id)
-        )
-        return S_GROUP_SELECT
+        return await show_team_picker(update, ctx, f"Команда создана!\nID: {team_id}\nКод: {code}\nТеперь выбери группу, чтобы перейти в её настройки.")
 
     if ctx.user_data.get("await_join_code"):
         code = (update.effective_message.text or "").strip().upper()
-        conn = db()
-        team = conn.execute("SELECT id, name FROM teams WHERE invite_code=?", (code,)).fetchone()
+        team = await repo.join_team(code, update.effective_user.id)
         if not team:
             await update.effective_message.reply_text("Неверный код. Попробуйте снова.", reply_markup=cancel_kb_to_menu()); return S_JOIN_CODE
-        with conn:
-            conn.execute("INSERT OR IGNORE INTO team_members (team_id, tg_id) VALUES (?, ?)", (team["id"], update.effective_user.id))
         ctx.user_data.pop("await_join_code", None)
-        await update.effective_message.reply_text(f"Ок! Вы в команде «{team['name']}» (ID {team['id']}). Теперь выберите группу в меню.", reply_markup=team_choice_keyboard(update.effective_user.id))
-        return S_GROUP_SELECT
+        return await show_team_picker(update, ctx, f"Ок! Вы в команде «{team['name']}» (ID {team['id']}). Теперь выберите группу в меню.")
 
     msg = update.effective_message
     if msg and msg.reply_to_message and not msg.from_user.is_bot:
         uid = update.effective_user.id
         text = msg.text or msg.caption or ""
         if text.strip():
-            conn = db()
-            teams = conn.execute("SELECT team_id FROM team_members WHERE tg_id=?", (uid,)).fetchall()
-            updated_any = False
-            for trow in teams:
-                team_id = trow["team_id"]
-                team = conn.execute("SELECT tz FROM teams WHERE id=?", (team_id,)).fetchone()
-                if not team: continue
-                today = today_in_tz(team["tz"]).isoformat()
-                st = conn.execute("SELECT id FROM standups WHERE team_id=? AND date_iso=? ORDER BY id DESC LIMIT 1", (team_id, today)).fetchone()
-                if not st: continue
-                upd = conn.execute("SELECT id, answered FROM updates WHERE standup_id=? AND tg_id=?", (st["id"], uid)).fetchone()
-                if not upd or upd["answered"] == 1: continue
-                with conn:
-                    conn.execute("UPDATE updates SET text=?, created_utc=?, answered=1 WHERE id=?", (text.strip(), now_utc().isoformat(), upd["id"]))
-                updated_any = True
-            await msg.reply_text("Принято. Спасибо!" if updated_any else "Ответ сохранён или активных дэйликов нет.")
+            replied = msg.reply_to_message
+            to_bot = bool(replied.from_user and replied.from_user.id == ctx.bot.id)
+            outcome = await accept_answer(uid, text.strip(), msg.chat_id, replied.message_id, to_bot)
+            await msg.reply_text(ANSWER_REPLIES[outcome])
         return ConversationHandler.END
 
     return ConversationHandler.END
 
 
+async def accept_answer(uid: int, text: str, chat_id: int, reply_to: int, reply_to_bot: bool = False) -> str:
+    """A reply to a known prompt costs one index lookup and one write; the database decides the rest."""
+    hit = active.match(uid, chat_id, reply_to)
+    if hit:
+        standup_id, update_id = hit
+        # Either way the entry is done: answered now, or answered/closed behind the index's back.
+        active.discard(uid, standup_id)
+        if await repo.answer_update(update_id, standup_id, text):
+            return "accepted"
+    return await repo.record_answer(uid, text, chat_id, reply_to, reply_to_bot)
+
+
+ANSWER_REPLIES = {
+    "accepted": "Принято. Спасибо!",
+    "closed": "Этот дэйлик уже завершён, итоги отправлены.",
+    "ambiguous": "У вас несколько активных дэйликов. Ответьте реплаем на сообщение с вопросами нужной команды.",
+    "none": "Ответ сохранён или активных дэйликов нет.",
+}
+
+
 async def on_error(update: object, context):
     try:
         print("[ERROR]", context.error)
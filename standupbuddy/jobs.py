@@ -1,126 +1,163 @@
-import json
-from datetime import timedelta
+from datetime import datetime, timedelta
+from html import escape
 
 from telegram import ForceReply
-from telegram.constants import ParseMode
-from telegram.ext import Application, ContextTypes
+from telegram.constants import MessageLimit, ParseMode
+from telegram.ext import Application
 
-from .config import REMIND_AFTER_MIN, SUMMARY_AFTER_MIN
-from .db import db
-from .utils import parse_hhmm, tz_from_str, today_in_tz, now_utc, parse_reminder_days
+from . import metrics, repo
+from .active import index as active
+from .outbound import Priority
+from .outbox import worker as outbox
+from .config import REMIND_AFTER_MIN, SUMMARY_AFTER_MIN, STARTUP_CATCHUP_MIN
+from .scheduler import MinuteScheduler
+from .timers import TimerWorker
+from .utils import now_utc, parse_hhmm, parse_reminder_days
 
 
 async def remove_daily_job(app: Application, team_id: int):
-    for j in app.job_queue.get_jobs_by_name(f"daily_{team_id}"):
-        j.schedule_removal()
+    scheduler.remove_team(team_id)
 
 
 async def reschedule_daily_job(app: Application, team_id: int):
-    await remove_daily_job(app, team_id)
-    conn = db()
-    team = conn.execute("SELECT reminder_time, tz, reminder_days FROM teams WHERE id=?", (team_id,)).fetchone()
+    team = await repo.get_schedule(team_id)
     if not team or not team["reminder_time"]:
+        scheduler.remove_team(team_id)
         return
-    hhmm = parse_hhmm(team["reminder_time"])
-    tzinfo = tz_from_str(team["tz"])
-    days = parse_reminder_days(team["reminder_days"])
-    app.job_queue.run_daily(
-        callback=daily_job_callback,
-        time=hhmm, days=days, name=f"daily_{team_id}", data={"team_id": team_id}, tzinfo=tzinfo
-    )
+    scheduler.set_team(team_id, parse_hhmm(team["reminder_time"]), team["tz"], parse_reminder_days(team["reminder_days"]))
+
 
+async def restore_schedules(app: Application) -> int:
+    """Load every team schedule into the scheduler from one query. Returns the team count.
 
-async def daily_job_callback(ctx: ContextTypes.DEFAULT_TYPE):
-    await start_standup(ctx.application, ctx.job.data["team_id"])
+    Stored next_run_utc values that no longer match (runs missed while the
+    bot was down, or timezone rules changed) are rewritten in one batch.
+    """
+    rows = await repo.team_schedules()
+    schedules, stored = [], {}
+    for r in rows:
+        try:
+            schedules.append((r["id"], parse_hhmm(r["reminder_time"]), r["tz"], parse_reminder_days(r["reminder_days"])))
+        except ValueError:
+            print(f"Skipping team {r['id']}: bad reminder time {r['reminder_time']!r}")
+            continue
+        stored[r["id"]] = r["next_run_utc"]
+    next_runs = scheduler.load(schedules)
+    changed = [(at.isoformat(), team_id) for team_id, at in next_runs.items() if at.isoformat() != stored[team_id]]
+    await repo.set_next_runs(changed)
+    return len(schedules)
+
+
+async def missed_team_ids() -> list[int]:
+    """Teams whose scheduled run fell within the last STARTUP_CATCHUP_MIN minutes."""
+    now = now_utc()
+    return await repo.teams_due_between((now - timedelta(minutes=STARTUP_CATCHUP_MIN)).isoformat(), now.isoformat())
 
 
 async def start_standup(app: Application, team_id: int, manual: bool = False):
-    conn = db()
-    team = conn.execute("SELECT id, name, tz FROM teams WHERE id=?", (team_id,)).fetchone()
-    if not team:
+    created = await repo.create_standup(team_id, manual)
+    if not created:
         return
-    tz_str = team["tz"]
-    today = today_in_tz(tz_str).isoformat()
-    existed = conn.execute("SELECT id FROM standups WHERE team_id=? AND date_iso=?", (team_id, today)).fetchone()
-    if existed and not manual:
-        return
-    members = [r["tg_id"] for r in conn.execute("SELECT tg_id FROM team_members WHERE team_id=?", (team_id,)).fetchall()]
-    if not members:
-        return
-    with conn:
-        cur = conn.execute("INSERT INTO standups (team_id, date_iso, started_utc) VALUES (?, ?, ?)", (team_id, today, now_utc().isoformat()))
-        standup_id = cur.lastrowid
-        for uid in members:
-            conn.execute("INSERT INTO updates (standup_id, tg_id, answered) VALUES (?, ?, 0)", (standup_id, uid))
+    team, standup_id, members = created
+    active.add(standup_id, members)
     text = (f"🕒 Дэйлик команды «{team['name']}»\n\n"
             "Ответьте одним сообщением:\n— Что делал вчера?\n— Что планируешь сегодня?\n— Есть ли блокеры?")
-    for uid in members:
-        try:
-            await app.bot.send_message(chat_id=uid, text=text, reply_markup=ForceReply(selective=True))
-        except Exception:
-            pass
-    app.job_queue.run_once(remind_unanswered, when=timedelta(minutes=REMIND_AFTER_MIN), name=f"remind_{standup_id}", data={"standup_id": standup_id, "team_id": team_id})
-    app.job_queue.run_once(post_summary, when=timedelta(minutes=SUMMARY_AFTER_MIN), name=f"summary_{standup_id}", data={"standup_id": standup_id, "team_id": team_id})
-
-
-async def remind_unanswered(ctx: ContextTypes.DEFAULT_TYPE):
-    standup_id = ctx.job.data["standup_id"]
-    team_id = ctx.job.data["team_id"]
-    conn = db()
-    team = conn.execute("SELECT name FROM teams WHERE id=?", (team_id,)).fetchone()
-    rows = conn.execute("SELECT tg_id FROM updates WHERE standup_id=? AND answered=0", (standup_id,)).fetchall()
-    if not rows:
+    # The reminder and summary timers were stored with the standup itself.
+    timers.kick()
+    prompt = ForceReply(selective=True)
+    await outbox.send(
+        [{"chat_id": uid, "text": text, "reply_markup": prompt, "update_id": update_id} for update_id, uid in members],
+        f"prompt standup={standup_id}",
+        Priority.PROMPT,
+    )
+
+
+async def remind_unanswered(app: Application, standup_id: int, team_id: int, due: datetime):
+    # A reminder that would land after the summary is useless: drop it instead.
+    ttl = (due + timedelta(minutes=SUMMARY_AFTER_MIN - REMIND_AFTER_MIN) - now_utc()).total_seconds()
+    if ttl <= 0:
+        return
+    team, pending = await repo.unanswered(team_id, standup_id)
+    if not team or not pending:
         return
     text = f"⏰ Напоминание по дэйлику «{team['name']}». Пожалуйста, ответьте реплаем."
-    for r in rows:
-        try:
-            await ctx.application.bot.send_message(r["tg_id"], text)
-        except Exception:
-            pass
-
-
-async def post_summary(ctx: ContextTypes.DEFAULT_TYPE):
-    standup_id = ctx.job.data["standup_id"]
-    team_id = ctx.job.data["team_id"]
-    conn = db()
-    team = conn.execute("SELECT name, managers_json FROM teams WHERE id=?", (team_id,)).fetchone()
-    managers = json.loads(team["managers_json"]) if team else []
-    members = conn.execute(
-        """
-        SELECT u.tg_id, u.name, COALESCE(upd.text, '') AS text, upd.answered AS answered
-        FROM team_members tm
-        JOIN users u ON u.tg_id = tm.tg_id
-        LEFT JOIN updates upd ON upd.tg_id = tm.tg_id AND upd.standup_id=?
-        WHERE tm.team_id=?
-        ORDER BY u.name COLLATE NOCASE
-        """,
-        (standup_id, team_id),
-    ).fetchall()
-    lines = [f"🧾 Итоги дэйлика «{team['name']}»:"]
-    for r in members:
-        if r["answered"]:
-            status = "✅"
-            body = (r["text"] or "").strip() or "_пустой ответ_"
-        else:
-            status = "❌"
-            body = "— _не ответил_"
-        lines.append(f"{status} <b>{r['name']}</b>\n{body}")
-    summary = "\n\n".join(lines)
-    
-    # Send to all members
-    sent_to = set()
+    await outbox.send(
+        # With update_id the reminder's message id is recorded, so a reply to it lands in this standup.
+        [
+            {"chat_id": uid, "text": text, "dedupe_key": f"reminder:{standup_id}:{uid}", "update_id": update_id}
+            for update_id, uid in pending
+        ],
+        f"reminder standup={standup_id}",
+        Priority.REMINDER,
+        ttl=ttl,
+    )
+
+
+def _split_escaped(text: str, limit: int) -> list[str]:
+    """HTML-escape `text` into pieces of at most `limit` chars, never cutting an entity."""
+    pieces, current = [], ""
+    for line in text.split("\n"):
+        escaped = escape(line)
+        units = [escaped] if len(escaped) <= limit else [escape(ch) for ch in line]
+        sep = "\n" if current else ""
+        for unit in units:
+            if len(current) + len(sep) + len(unit) > limit:
+                pieces.append(current)
+                current, sep = "", ""
+            current += sep + unit
+            sep = ""
+    pieces.append(current)
+    return pieces
+
+
+def render_summary(team_name: str, members, limit: int = MessageLimit.MAX_TEXT_LENGTH) -> list[str]:
+    """Summary as HTML messages of at most `limit` chars, split between members."""
+    blocks = [f"🧾 Итоги дэйлика «{escape(team_name)}»:"]
     for r in members:
-        sent_to.add(r["tg_id"])
-        try:
-            await ctx.application.bot.send_message(chat_id=r["tg_id"], text=summary, parse_mode=ParseMode.HTML)
-        except Exception:
-            pass
-    
-    # Send to managers (including those who are also members)
-    for mid in managers:
-        try:
-            await ctx.application.bot.send_message(chat_id=mid, text=summary, parse_mode=ParseMode.HTML)
-        except Exception:
-            pass
+        head = f"{'✅' if r['answered'] else '❌'} <b>{escape(r['name'])}</b>"
+        if not r["answered"]:
+            blocks.append(f"{head}\n— <i>не ответил</i>")
+            continue
+        body = (r["text"] or "").strip()
+        if not body:
+            blocks.append(f"{head}\n<i>пустой ответ</i>")
+            continue
+        # An answer longer than a whole message is continued under the same heading.
+        for part in _split_escaped(body, limit - len(head) - 1):
+            blocks.append(f"{head}\n{part}")
+
+    chunks, current = [], ""
+    for block in blocks:
+        if current and len(current) + 2 + len(block) > limit:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{block}" if current else block
+    chunks.append(current)
+    return chunks
+
+
+async def post_summary(app: Application, standup_id: int, team_id: int, due: datetime):
+    team, managers, members = await repo.summary_rows(team_id, standup_id)
+    active.close(standup_id)
+    if not team:
+        return
+    chunks = render_summary(team["name"], members)
+
+    # Members first, then managers who are not members; everyone gets it once.
+    listed = [r["tg_id"] for r in members if not r["blocked"]] + list(managers)
+    recipients = list(dict.fromkeys(listed))
+    metrics.incr("summary_sends_saved", (len(listed) - len(recipients)) * len(chunks))
+    await outbox.send(
+        [
+            {"chat_id": uid, "text": chunk, "parse_mode": ParseMode.HTML, "dedupe_key": f"summary:{standup_id}:{uid}:{i}"}
+            for uid in recipients
+            for i, chunk in enumerate(chunks)
+        ],
+        f"summary standup={standup_id}",
+        Priority.SUMMARY,
+        summary_of=standup_id,
+    )
 
 
+scheduler = MinuteScheduler(start_standup)
+timers = TimerWorker({"remind": remind_unanswered, "summary": post_summary})
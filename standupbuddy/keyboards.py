@@ -1,90 +1,158 @@
+import bisect
+import functools
+from operator import itemgetter
+
 from telegram import InlineKeyboardMarkup, InlineKeyboardButton
 
-from .db import db
+from . import repo
+from .callbacks import encode
+from .cache import team_lists
+from .config import TEAM_PAGE_SIZE
+
+# Markups are immutable, so keyboards that never change are built once and
+# shared, and the variable ones are memoized by everything they depend on.
+
+MAIN_MENU = InlineKeyboardMarkup([
+    [InlineKeyboardButton("➕ Создать команду", callback_data=encode("m", "create"))],
+    [InlineKeyboardButton("🔗 Вступить по коду", callback_data=encode("m", "join"))],
+    [InlineKeyboardButton("👥 Мои команды", callback_data=encode("m", "teams"))],
+])
+CANCEL_TO_MENU = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Отмена", callback_data=encode("back", "menu"))]])
+CANCEL_TO_GROUP = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Отмена", callback_data=encode("back", "group"))]])
+BACK_TO_GROUP = InlineKeyboardMarkup([[InlineKeyboardButton("◀️ Назад", callback_data=encode("back", "group"))]])
 
 
 def main_menu(uid: int) -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("➕ Создать команду", callback_data="m:create")],
-        [InlineKeyboardButton("🔗 Вступить по коду", callback_data="m:join")],
-        [InlineKeyboardButton("👥 Мои команды", callback_data="m:teams")],
-    ])
+    return MAIN_MENU
 
 
 def group_menu_keyboard(team_row, is_manager: bool, self_id: int) -> InlineKeyboardMarkup:
-    has_schedule = bool(team_row["reminder_time"])
+    return _group_menu(team_row["id"], bool(is_manager), bool(team_row["reminder_time"]))
+
+
+@functools.lru_cache(maxsize=4096)
+def _group_menu(team_id: int, is_manager: bool, has_schedule: bool) -> InlineKeyboardMarkup:
     btns = []
     if has_schedule:
-        btns.append([InlineKeyboardButton("📄 Посмотреть расписание", callback_data=f"gm:view:{team_row['id']}")])
+        btns.append([InlineKeyboardButton("📄 Посмотреть расписание", callback_data=encode("gm", "view", team_id))])
         if is_manager:
-            btns.append([InlineKeyboardButton("✏️ Редактировать расписание", callback_data=f"gm:edit:{team_row['id']}")])
-            btns.append([InlineKeyboardButton("🗑 Удалить расписание", callback_data=f"gm:del:{team_row['id']}")])
-            btns.append([InlineKeyboardButton("▶️ Запустить сейчас", callback_data=f"gm:run:{team_row['id']}")])
+            btns.append([InlineKeyboardButton("✏️ Редактировать расписание", callback_data=encode("gm", "edit", team_id))])
+            btns.append([InlineKeyboardButton("🗑 Удалить расписание", callback_data=encode("gm", "del", team_id))])
+            btns.append([InlineKeyboardButton("▶️ Запустить сейчас", callback_data=encode("gm", "run", team_id))])
     else:
         if is_manager:
-            btns.append([InlineKeyboardButton("➕ Создать расписание", callback_data=f"gm:edit:{team_row['id']}")])
-    btns.append([InlineKeyboardButton("👥 Участники", callback_data=f"gm:members:{team_row['id']}")])
-    btns.append([InlineKeyboardButton("ℹ️ Инфо о группе", callback_data=f"gm:info:{team_row['id']}")])
-    btns.append([InlineKeyboardButton("↩️ Выйти из группы", callback_data=f"gm:leave:{team_row['id']}")])
+            btns.append([InlineKeyboardButton("➕ Создать расписание", callback_data=encode("gm", "edit", team_id))])
+    btns.append([InlineKeyboardButton("👥 Участники", callback_data=encode("gm", "members", team_id))])
+    btns.append([InlineKeyboardButton("ℹ️ Инфо о группе", callback_data=encode("gm", "info", team_id))])
+    btns.append([InlineKeyboardButton("↩️ Выйти из группы", callback_data=encode("gm", "leave", team_id))])
     if is_manager:
-        btns.append([InlineKeyboardButton("❌ Удалить участника…", callback_data=f"gm:rmembers:{team_row['id']}")])
-    btns.append([InlineKeyboardButton("◀️ К списку групп", callback_data="back:teams")])
-    btns.append([InlineKeyboardButton("🏠 В меню", callback_data="back:menu")])
+        btns.append([InlineKeyboardButton("❌ Удалить участника…", callback_data=encode("gm", "rmembers", team_id))])
+    btns.append([InlineKeyboardButton("◀️ К списку групп", callback_data=encode("back", "teams"))])
+    btns.append([InlineKeyboardButton("🏠 В меню", callback_data=encode("back", "menu"))])
     return InlineKeyboardMarkup(btns)
 
 
 def cancel_kb_to_menu():
-    return InlineKeyboardMarkup([[InlineKeyboardButton("❌ Отмена", callback_data="back:menu")]])
+    return CANCEL_TO_MENU
 
 
 def cancel_kb_to_group():
-    return InlineKeyboardMarkup([[InlineKeyboardButton("❌ Отмена", callback_data="back:group")]])
-
-
-def team_choice_keyboard(uid: int) -> InlineKeyboardMarkup:
-    conn = db()
-    rows = conn.execute(
-        "SELECT t.id, t.name FROM teams t JOIN team_members m ON m.team_id=t.id WHERE m.tg_id=? ORDER BY t.id",
-        (uid,),
-    ).fetchall()
-    if not rows:
-        return InlineKeyboardMarkup([[InlineKeyboardButton("🏠 В меню", callback_data="back:menu")]])
-    buttons = [[InlineKeyboardButton(f"{r['name']} (ID {r['id']})", callback_data=f"g:{r['id']}")] for r in rows]
-    buttons.append([InlineKeyboardButton("🏠 В меню", callback_data="back:menu")])
+    return CANCEL_TO_GROUP
+
+
+async def user_team_list(uid: int) -> list[tuple[int, str]]:
+    """The user's `(team_id, name)` pairs by team id, cached until their membership changes."""
+    teams = team_lists.get(uid)
+    if teams is None:
+        generation = team_lists.generation
+        teams = [(r["id"], r["name"]) for r in await repo.user_teams(uid)]
+        team_lists.put(uid, teams, generation)
+    return teams
+
+
+async def team_choice_keyboard(uid: int, after: int = 0, before: int | None = None, prefix: str = "") -> InlineKeyboardMarkup:
+    """One page of the user's teams: ids above `after`, or the page ending below `before`.
+
+    `prefix` keeps only teams whose name starts with it (case-insensitive).
+    """
+    teams = await user_team_list(uid)
+    if prefix:
+        folded = prefix.casefold()
+        teams = [t for t in teams if t[1].casefold().startswith(folded)]
+    if before is not None:
+        end = bisect.bisect_left(teams, before, key=itemgetter(0))
+        start = max(0, end - TEAM_PAGE_SIZE)
+    else:
+        start = bisect.bisect_right(teams, after, key=itemgetter(0))
+        end = start + TEAM_PAGE_SIZE
+    page = teams[start:end]
+    buttons = [[InlineKeyboardButton(f"{name} (ID {team_id})", callback_data=encode("g", "", team_id))] for team_id, name in page]
+    nav = []
+    if page and start > 0:
+        nav.append(InlineKeyboardButton("◀️ Назад", callback_data=encode("tl", "p", page[0][0])))
+    if page and end < len(teams):
+        nav.append(InlineKeyboardButton("Дальше ▶️", callback_data=encode("tl", "n", page[-1][0])))
+    if nav:
+        buttons.append(nav)
+    if prefix:
+        buttons.append([InlineKeyboardButton("✖️ Сбросить поиск", callback_data=encode("tl", "all"))])
+    buttons.append([InlineKeyboardButton("🏠 В меню", callback_data=encode("back", "menu"))])
     return InlineKeyboardMarkup(buttons)
 
 
-def tz_offset_keyboard() -> InlineKeyboardMarkup:
+def _build_tz_offset_keyboard() -> InlineKeyboardMarkup:
     rows, row = [], []
     for off in range(-12, 15):
-        row.append(InlineKeyboardButton(f"UTC{off:+d}", callback_data=f"tzo:{off}"))
+        row.append(InlineKeyboardButton(f"UTC{off:+d}", callback_data=encode("tzo", "", off)))
         if len(row) == 3:
             rows.append(row); row = []
     if row:
         rows.append(row)
-    rows.append([InlineKeyboardButton("◀️ Назад", callback_data="back:group")])
+    rows.append([InlineKeyboardButton("◀️ Назад", callback_data=encode("back", "group"))])
     return InlineKeyboardMarkup(rows)
 
 
+TZ_OFFSET_KEYBOARD = _build_tz_offset_keyboard()
+SCHEDULE_PRESET_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📅 Каждый день", callback_data=encode("sch", "preset:everyday"))],
+    [InlineKeyboardButton("🏢 Будни (Пн–Пт)", callback_data=encode("sch", "preset:weekdays"))],
+    [InlineKeyboardButton("🎉 Выходные (Сб–Вс)", callback_data=encode("sch", "preset:weekends"))],
+    [InlineKeyboardButton("🧩 Кастомные дни…", callback_data=encode("sch", "custom:start"))],
+    [InlineKeyboardButton("◀️ Назад", callback_data=encode("back", "group"))],
+])
+
+
+def tz_offset_keyboard() -> InlineKeyboardMarkup:
+    return TZ_OFFSET_KEYBOARD
+
+
 def schedule_preset_keyboard() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("📅 Каждый день", callback_data="sch:preset:everyday")],
-        [InlineKeyboardButton("🏢 Будни (Пн–Пт)", callback_data="sch:preset:weekdays")],
-        [InlineKeyboardButton("🎉 Выходные (Сб–Вс)", callback_data="sch:preset:weekends")],
-        [InlineKeyboardButton("🧩 Кастомные дни…", callback_data="sch:custom:start")],
-        [InlineKeyboardButton("◀️ Назад", callback_data="back:group")],
-    ])
+    return SCHEDULE_PRESET_KEYBOARD
+
+
+def days_mask(days) -> int:
+    """Weekday numbers (0=Mon) as a 7-bit mask."""
+    mask = 0
+    for d in days:
+        mask |= 1 << d
+    return mask
+
+
+def mask_days(mask: int) -> tuple[int, ...]:
+    return tuple(d for d in range(7) if mask >> d & 1)
 
 
-def schedule_custom_keyboard(selected: set[int]) -> InlineKeyboardMarkup:
+@functools.lru_cache(maxsize=128)
+def schedule_custom_keyboard(mask: int) -> InlineKeyboardMarkup:
+    """Day picker for the selection `mask`; there are only 128 of them."""
     names = ["Пн","Вт","Ср","Чт","Пт","Сб","Вс"]
     rows = []
     for i, n in enumerate(names):
-        mark = "✅" if i in selected else "☐"
-        rows.append([InlineKeyboardButton(f"{mark} {n}", callback_data=f"sch:custom:toggle:{i}")])
-    rows.append([InlineKeyboardButton("Сохранить", callback_data="sch:custom:save"),
-                 InlineKeyboardButton("Сброс", callback_data="sch:custom:reset")])
-    rows.append([InlineKeyboardButton("◀️ Назад", callback_data="back:schedule")])
+        mark = "✅" if mask >> i & 1 else "☐"
+        rows.append([InlineKeyboardButton(f"{mark} {n}", callback_data=encode("sch", "custom:toggle", i))])
+    rows.append([InlineKeyboardButton("Сохранить", callback_data=encode("sch", "custom:save")),
+                 InlineKeyboardButton("Сброс", callback_data=encode("sch", "custom:reset"))])
+    rows.append([InlineKeyboardButton("◀️ Назад", callback_data=encode("back", "schedule"))])
     return InlineKeyboardMarkup(rows)
 
 
@@ -1,16 +1,20 @@
 import asyncio
+import hmac
 import signal
 import sys
-import os
+import time
 from aiohttp import web
 
 from telegram import Update
 from telegram.error import Conflict
 
 from .app import build_app
-from .config import BOT_TOKEN
-from .db import init_db, db
-from .jobs import reschedule_daily_job
+from .config import BOT_TOKEN, PORT, SHUTDOWN_DRAIN_SEC, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_URL
+from . import repo
+from .active import index as active
+from .db import close_db, init_db
+from .jobs import missed_team_ids, restore_schedules, scheduler, timers
+from .outbox import worker as outbox
 
 
 async def health_check(request):
@@ -18,88 +22,162 @@ async def health_check(request):
     return web.Response(text="OK", status=200)
 
 
-async def start_web_server():
-    """Start a simple web server for health checks"""
-    app = web.Application()
-    app.router.add_get('/', health_check)
-    app.router.add_get('/health', health_check)
-    
-    runner = web.AppRunner(app)
+def telegram_webhook(app):
+    """POST handler feeding Telegram's pushed updates into app.update_queue."""
+    secret = (WEBHOOK_SECRET or "").encode()
+
+    async def handle(request):
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "").encode()
+        if not secret or not hmac.compare_digest(token, secret):
+            return web.Response(status=403)
+        try:
+            update = Update.de_json(await request.json(), app.bot)
+        except Exception as e:
+            print(f"Rejected webhook payload: {e}")
+            return web.Response(status=400)
+        await app.update_queue.put(update)
+        return web.Response(status=200)
+
+    return handle
+
+
+def build_web_app(app=None) -> web.Application:
+    web_app = web.Application()
+    web_app.router.add_get('/', health_check)
+    web_app.router.add_get('/health', health_check)
+    if app is not None and WEBHOOK_URL:
+        web_app.router.add_post(WEBHOOK_PATH, telegram_webhook(app))
+    return web_app
+
+
+async def start_web_server(app=None):
+    """Start the web server for health checks and, in webhook mode, Telegram updates"""
+    runner = web.AppRunner(build_web_app(app))
     await runner.setup()
-    site = web.TCPSite(runner, '0.0.0.0', int(os.getenv('PORT', 8080)))
+    site = web.TCPSite(runner, '0.0.0.0', PORT)
     await site.start()
     print(f"Health check server started on port {site.name}")
     return runner
 
 
-async def restore_jobs(app):
-    conn = db()
-    teams = conn.execute("SELECT id FROM teams WHERE reminder_time IS NOT NULL").fetchall()
-    for r in teams:
-        await reschedule_daily_job(app, r["id"])
+async def start_updates(app) -> None:
+    """Register the webhook, or start long polling when no WEBHOOK_URL is set."""
+    if WEBHOOK_URL:
+        await app.bot.set_webhook(
+            url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            allowed_updates=Update.ALL_TYPES,
+            secret_token=WEBHOOK_SECRET,
+        )
+        print(f"Receiving updates via webhook at {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}")
+    else:
+        await app.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+
+
+async def stop_updates(app) -> None:
+    if app.updater.running:
+        await app.updater.stop()
+
+
+async def restore_jobs(app) -> list[int]:
+    """Load schedules and return the teams whose run was missed while the bot was down."""
+    started = time.perf_counter()
+    missed = await missed_team_ids()
+    restored = await restore_schedules(app)
+    scheduler.start(app)
+    active.load(await repo.open_updates())
+    print(f"Restored {restored} team schedules and {len(active)} open standups in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return missed
+
+
+async def shutdown(app, web_runner) -> None:
+    """Stop taking updates, let in-flight standups finish within SHUTDOWN_DRAIN_SEC, close the DB.
+
+    Anything still unsent at the deadline stays in the outbox and goes out on
+    the next start; unfinished timers fire again.
+    """
+    deadline = time.monotonic() + SHUTDOWN_DRAIN_SEC
+    started = phase_started = time.perf_counter()
+
+    def phase(name: str) -> None:
+        nonlocal phase_started
+        now = time.perf_counter()
+        print(f"Shutdown: {name} in {(now - phase_started) * 1000:.0f} ms")
+        phase_started = now
+
+    await stop_updates(app)
+    await web_runner.cleanup()
+    phase("stopped taking updates")
+
+    # app.stop() finishes queued updates, running jobs (the minute tick and
+    # its start_standup fan-out) and app.create_task() work.
+    drain = [timers.stop(SHUTDOWN_DRAIN_SEC)]
+    if app.running:
+        drain.append(app.stop())
+    try:
+        await asyncio.wait_for(asyncio.gather(*drain), max(0.0, deadline - time.monotonic()))
+    except asyncio.TimeoutError:
+        print("Shutdown: drain deadline reached, unfinished standups resume on next start")
+    await outbox.stop(max(0.0, deadline - time.monotonic()))
+    phase("drained in-flight work")
+
+    await app.shutdown()
+    phase("flushed application state")
+
+    repo.shutdown()
+    close_db()
+    phase("checkpointed and closed the database")
+    print(f"Shutdown complete in {time.perf_counter() - started:.2f}s")
 
 
 def main():
     if not BOT_TOKEN:
         raise SystemExit("Установите BOT_TOKEN в окружении.")
+    if WEBHOOK_URL and not WEBHOOK_SECRET:
+        raise SystemExit("Установите WEBHOOK_SECRET для режима webhook.")
     init_db()
     app = build_app()
 
-    async def _run():
-        await restore_jobs(app)
+    async def _run() -> int:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+        missed = await restore_jobs(app)
         await app.initialize()
         await app.start()
+        await outbox.start(app.bot)
+        await timers.start(app)
+        if missed:
+            print(f"Starting {len(missed)} standups missed while the bot was down")
+            app.create_task(scheduler.fire(app, missed))
         
-        # Start health check server
-        web_runner = await start_web_server()
+        # Start health check (and webhook) server
+        web_runner = await start_web_server(app)
         
-        # Add error handling for Conflict error
+        code = 0
         try:
-            await app.updater.start_polling(allowed_updates=Update.ALL_TYPES)
-            print("StandupBuddy started.")
-            try:
-                await asyncio.Event().wait()
-            except KeyboardInterrupt:
-                print("Shutting down...")
-            finally:
-                await web_runner.cleanup()
-                await app.updater.stop()
-                await app.stop()
-                await app.shutdown()
-        except Conflict as e:
-            print(f"Bot conflict detected: {e}")
-            print("This usually means another instance is running. Waiting 30 seconds before retry...")
-            await asyncio.sleep(30)
-            # Retry once
             try:
-                await app.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+                await start_updates(app)
+                print("StandupBuddy started.")
+            except Conflict as e:
+                # Polling only: another instance is still fetching updates.
+                print(f"Bot conflict detected: {e}")
+                print("This usually means another instance is running. Waiting 30 seconds before retry...")
+                await asyncio.sleep(30)
+                await start_updates(app)
                 print("StandupBuddy started on retry.")
-                await asyncio.Event().wait()
-            except Exception as retry_error:
-                print(f"Retry failed: {retry_error}")
-                sys.exit(1)
-            finally:
-                await web_runner.cleanup()
-                await app.updater.stop()
-                await app.stop()
-                await app.shutdown()
+            await stop.wait()
+            print("Shutting down...")
         except Exception as e:
             print(f"Unexpected error: {e}")
-            await web_runner.cleanup()
-            sys.exit(1)
+            code = 1
+        finally:
+            await shutdown(app, web_runner)
+        return code
 
-    # Handle graceful shutdown
-    def signal_handler(signum, frame):
-        print(f"Received signal {signum}, shutting down gracefully...")
-        sys.exit(0)
-    
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
-
-    asyncio.run(_run())
+    sys.exit(asyncio.run(_run()))
 
 
 if __name__ == "__main__":
     main()
-
-
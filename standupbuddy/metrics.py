@@ -0,0 +1,14 @@
+from collections import Counter, deque
+
+
+# Process-wide counters, reported by /health.
+counters: Counter = Counter()
+recent_fanouts: deque = deque(maxlen=20)
+
+
+def incr(name: str, n: int = 1) -> None:
+    counters[name] += n
+
+
+def snapshot() -> dict:
+    return dict(counters)
@@ -0,0 +1,270 @@
+import json
+
+from .utils import next_run_utc, now_utc
+
+
+def _managers_json_to_rows(conn) -> None:
+    columns = [r[1] for r in conn.execute("PRAGMA table_info(teams)").fetchall()]
+    if "managers_json" not in columns:
+        return
+    rows = []
+    for team_id, raw in conn.execute("SELECT id, managers_json FROM teams").fetchall():
+        try:
+            managers = json.loads(raw or "[]")
+        except ValueError:
+            managers = []
+        rows.extend((team_id, int(uid)) for uid in managers)
+    conn.executemany("INSERT OR IGNORE INTO team_managers (team_id, tg_id) VALUES (?, ?)", rows)
+    conn.execute("ALTER TABLE teams DROP COLUMN managers_json")
+
+
+def _add_users_blocked_utc(conn) -> None:
+    columns = [r[1] for r in conn.execute("PRAGMA table_info(users)").fetchall()]
+    if "blocked_utc" not in columns:
+        conn.execute("ALTER TABLE users ADD COLUMN blocked_utc TEXT")
+
+
+def _add_teams_next_run_utc(conn) -> None:
+    columns = [r[1] for r in conn.execute("PRAGMA table_info(teams)").fetchall()]
+    if "next_run_utc" not in columns:
+        conn.execute("ALTER TABLE teams ADD COLUMN next_run_utc TEXT")
+    rows = conn.execute("SELECT id, reminder_time, tz, reminder_days FROM teams WHERE reminder_time IS NOT NULL").fetchall()
+    updates = []
+    for team_id, reminder_time, tz_name, days in rows:
+        try:
+            next_run = next_run_utc(reminder_time, tz_name, days)
+        except ValueError:
+            continue
+        updates.append((next_run.isoformat(), team_id))
+    conn.executemany("UPDATE teams SET next_run_utc=? WHERE id=?", updates)
+
+
+def _add_standups_closed_utc(conn) -> None:
+    columns = [r[1] for r in conn.execute("PRAGMA table_info(standups)").fetchall()]
+    if "closed_utc" not in columns:
+        conn.execute("ALTER TABLE standups ADD COLUMN closed_utc TEXT")
+    # Only standups still waiting for their summary stay open.
+    conn.execute(
+        "UPDATE standups SET closed_utc=? WHERE closed_utc IS NULL AND id NOT IN (SELECT standup_id FROM timers WHERE kind='summary')",
+        (now_utc().isoformat(),),
+    )
+
+
+def _add_prompt_columns(conn) -> None:
+    for table, column in (("updates", "prompt_chat_id"), ("updates", "prompt_message_id"), ("outbox", "update_id")):
+        columns = [r[1] for r in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+        if column not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER")
+
+
+def _add_standups_summary_utc(conn) -> None:
+    columns = [r[1] for r in conn.execute("PRAGMA table_info(standups)").fetchall()]
+    if "summary_utc" not in columns:
+        conn.execute("ALTER TABLE standups ADD COLUMN summary_utc TEXT")
+    # Closed standups whose summary timer is gone have had their summary queued.
+    conn.execute(
+        "UPDATE standups SET summary_utc=closed_utc WHERE closed_utc IS NOT NULL AND id NOT IN (SELECT standup_id FROM timers WHERE kind='summary')"
+    )
+
+
+def _drop_update_prompt_columns(conn) -> None:
+    conn.execute("DROP INDEX IF EXISTS ux_updates_prompt")
+    columns = [r[1] for r in conn.execute("PRAGMA table_info(updates)").fetchall()]
+    if "prompt_message_id" in columns:
+        conn.execute(
+            """
+            INSERT OR IGNORE INTO prompt_messages (chat_id, message_id, update_id)
+            SELECT prompt_chat_id, prompt_message_id, id FROM updates WHERE prompt_message_id IS NOT NULL
+            """
+        )
+    for column in ("prompt_chat_id", "prompt_message_id"):
+        if column in columns:
+            conn.execute(f"ALTER TABLE updates DROP COLUMN {column}")
+
+
+# Ordered, append-only. Each step is an SQL string or a callable taking the
+# connection, and must be safe to re-run against a database that already has
+# the change (IF NOT EXISTS, INSERT OR IGNORE, ...).
+MIGRATIONS = [
+    (1, "base schema", (
+        "CREATE TABLE IF NOT EXISTS users (tg_id INTEGER PRIMARY KEY, name TEXT NOT NULL)",
+        """
+        CREATE TABLE IF NOT EXISTS teams (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            invite_code TEXT UNIQUE NOT NULL,
+            tz TEXT NOT NULL DEFAULT 'UTC',
+            reminder_time TEXT,
+            reminder_days TEXT,
+            managers_json TEXT NOT NULL
+        )
+        """,
+        "CREATE TABLE IF NOT EXISTS team_members (team_id INTEGER NOT NULL, tg_id INTEGER NOT NULL, UNIQUE(team_id, tg_id))",
+        """
+        CREATE TABLE IF NOT EXISTS standups (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            team_id INTEGER NOT NULL,
+            date_iso TEXT NOT NULL,
+            started_utc TEXT NOT NULL,
+            remind_job_key TEXT,
+            summary_job_key TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS updates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            standup_id INTEGER NOT NULL,
+            tg_id INTEGER NOT NULL,
+            text TEXT,
+            created_utc TEXT,
+            answered INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+    )),
+    (2, "indexes for hot lookups", (
+        "CREATE INDEX IF NOT EXISTS idx_standups_team_date ON standups(team_id, date_iso)",
+        "CREATE INDEX IF NOT EXISTS idx_updates_standup_answered ON updates(standup_id, answered)",
+        "CREATE INDEX IF NOT EXISTS idx_team_members_tg ON team_members(tg_id)",
+    )),
+    (3, "one update row per user per standup", (
+        # Keep the answered row (or the oldest one) before enforcing uniqueness.
+        """
+        DELETE FROM updates WHERE id IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (PARTITION BY standup_id, tg_id ORDER BY answered DESC, id) AS rn
+                FROM updates
+            ) WHERE rn > 1
+        )
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_updates_standup_user ON updates(standup_id, tg_id)",
+    )),
+    (4, "team_managers table replaces teams.managers_json", (
+        """
+        CREATE TABLE IF NOT EXISTS team_managers (
+            team_id INTEGER NOT NULL,
+            tg_id INTEGER NOT NULL,
+            PRIMARY KEY (team_id, tg_id)
+        ) WITHOUT ROWID
+        """,
+        _managers_json_to_rows,
+    )),
+    (5, "durable outbox", (
+        """
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            parse_mode TEXT,
+            force_reply INTEGER NOT NULL DEFAULT 0,
+            priority INTEGER NOT NULL,
+            label TEXT,
+            dedupe_key TEXT UNIQUE,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_utc TEXT NOT NULL,
+            expires_utc TEXT,
+            claimed INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_utc TEXT NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(claimed, next_attempt_utc)",
+    )),
+    (6, "users.blocked_utc for users unreachable by the bot", (
+        _add_users_blocked_utc,
+    )),
+    (7, "durable reminder and summary timers", (
+        """
+        CREATE TABLE IF NOT EXISTS timers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            standup_id INTEGER NOT NULL,
+            team_id INTEGER NOT NULL,
+            due_utc TEXT NOT NULL,
+            UNIQUE (kind, standup_id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_timers_due ON timers(due_utc)",
+    )),
+    (8, "teams.next_run_utc", (
+        _add_teams_next_run_utc,
+        "CREATE INDEX IF NOT EXISTS idx_teams_next_run ON teams(next_run_utc)",
+    )),
+    (9, "open standups and a partial index over unanswered updates", (
+        _add_standups_closed_utc,
+        "CREATE INDEX IF NOT EXISTS idx_updates_open ON updates(tg_id) WHERE answered=0",
+    )),
+    (10, "prompt message ids on updates", (
+        _add_prompt_columns,
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_updates_prompt ON updates(prompt_chat_id, prompt_message_id)
+        WHERE prompt_message_id IS NOT NULL
+        """,
+    )),
+    (11, "conversation state and user_data persistence", (
+        "CREATE TABLE IF NOT EXISTS user_data (tg_id INTEGER PRIMARY KEY, data BLOB NOT NULL)",
+        """
+        CREATE TABLE IF NOT EXISTS conversations (
+            name TEXT NOT NULL,
+            key TEXT NOT NULL,
+            state TEXT NOT NULL,
+            PRIMARY KEY (name, key)
+        ) WITHOUT ROWID
+        """,
+    )),
+    (12, "standups.summary_utc", (
+        _add_standups_summary_utc,
+    )),
+    (13, "prompt_messages: every prompt and reminder message an update can be answered through", (
+        """
+        CREATE TABLE IF NOT EXISTS prompt_messages (
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            update_id INTEGER NOT NULL,
+            PRIMARY KEY (chat_id, message_id)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_prompt_messages_update ON prompt_messages(update_id)",
+        _drop_update_prompt_columns,
+    )),
+]
+
+
+def applied_versions(conn) -> set[int]:
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_utc TEXT NOT NULL)"
+    )
+    return {r[0] for r in conn.execute("SELECT version FROM schema_version").fetchall()}
+
+
+def migrate(conn, target: int | None = None) -> list[int]:
+    """Apply pending migrations up to `target` (default: latest). Returns applied versions."""
+    applied = []
+    done = applied_versions(conn)
+    for version, name, steps in MIGRATIONS:
+        if target is not None and version > target:
+            break
+        if version in done:
+            continue
+        # IMMEDIATE takes the write lock up front, so two processes starting
+        # at once cannot both apply the same step.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM schema_version WHERE version=?", (version,)).fetchone():
+                conn.rollback()
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(
+                "INSERT INTO schema_version (version, name, applied_utc) VALUES (?, ?, ?)",
+                (version, name, now_utc().isoformat()),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"Applied migration {version}: {name}")
+        applied.append(version)
+    return applied
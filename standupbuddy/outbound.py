@@ -0,0 +1,200 @@
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from enum import IntEnum
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from . import metrics
+from .config import (
+    SEND_RATE_PER_SEC, SEND_RATE_PER_CHAT_PER_SEC, SEND_MAX_RETRIES,
+    OUTBOUND_QUEUE_SIZE, INTERACTIVE_QUEUE_SIZE,
+)
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    PROMPT = 1
+    REMINDER = 2
+    SUMMARY = 3
+
+
+class Dropped(Exception):
+    """The request was discarded by a queue policy and never sent."""
+
+
+# How far into a queue the dispatcher looks for a request whose chat is not
+# on its per-chat cooldown, before moving to the next priority class.
+SCAN_DEPTH = 32
+
+
+@dataclass(eq=False)
+class _Ticket:
+    chat_id: int | str | None
+    priority: Priority
+    expires_at: float | None
+    merge_key: object
+    granted: asyncio.Future = field(repr=False)
+
+
+class OutboundScheduler(BaseRateLimiter):
+    """Central scheduler for every outgoing Bot API call.
+
+    Requests wait in one bounded queue per Priority class; a single
+    dispatcher grants send slots at Telegram's global rate, always to the
+    highest-priority request whose chat is off its per-chat cooldown. A full
+    queue makes new requests of that class wait (backpressure). Requests may
+    carry `rate_limit_args`:
+
+    - ``priority``: a Priority, default INTERACTIVE (menu edits, replies);
+    - ``ttl``: seconds after which an unsent request is dropped as stale;
+    - ``merge_key``: a request is dropped if one with the same key is queued.
+
+    A RetryAfter from Telegram pauses every class and the request is retried.
+    """
+
+    def __init__(
+        self,
+        per_sec: float = SEND_RATE_PER_SEC,
+        per_chat_per_sec: float = SEND_RATE_PER_CHAT_PER_SEC,
+        max_retries: int = SEND_MAX_RETRIES,
+        queue_size: int = OUTBOUND_QUEUE_SIZE,
+        interactive_queue_size: int = INTERACTIVE_QUEUE_SIZE,
+    ):
+        self.interval = 1.0 / per_sec
+        self.chat_interval = 1.0 / per_chat_per_sec
+        self.max_retries = max_retries
+        self._limits = {p: queue_size for p in Priority}
+        self._limits[Priority.INTERACTIVE] = interactive_queue_size
+        self._queues: dict[Priority, deque[_Ticket]] = {p: deque() for p in Priority}
+        self._not_full = {p: asyncio.Event() for p in Priority}
+        self._wakeup = asyncio.Event()
+        self._merge_keys: set = set()
+        self._next_slot = 0.0
+        self._next_chat_slot: dict[int | str, float] = {}
+        self._paused_until = 0.0
+        self._dispatcher: asyncio.Task | None = None
+
+    async def initialize(self) -> None:
+        self._ensure_dispatcher()
+
+    async def shutdown(self) -> None:
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        for q in self._queues.values():
+            while q:
+                self._reject(q.popleft(), "shutdown")
+
+    def _ensure_dispatcher(self) -> None:
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+
+    def depths(self) -> dict[str, int]:
+        return {p.name.lower(): len(q) for p, q in self._queues.items()}
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        metrics.incr("retry_after")
+        print(f"Telegram flood control: pausing all sends for {seconds:.0f}s")
+
+    # -------------------- queueing --------------------
+
+    def _reject(self, ticket: _Ticket, reason: str) -> None:
+        self._merge_keys.discard(ticket.merge_key)
+        metrics.incr(f"dropped_{reason}")
+        if not ticket.granted.done():
+            ticket.granted.set_exception(Dropped(reason))
+
+    async def _wait_turn(self, ticket: _Ticket) -> None:
+        q = self._queues[ticket.priority]
+        while len(q) >= self._limits[ticket.priority]:
+            self._not_full[ticket.priority].clear()
+            await self._not_full[ticket.priority].wait()
+        q.append(ticket)
+        depth = len(q)
+        name = f"peak_queue_{ticket.priority.name.lower()}"
+        if depth > metrics.counters[name]:
+            metrics.counters[name] = depth
+        self._ensure_dispatcher()
+        self._wakeup.set()
+        await ticket.granted
+
+    def _pick(self, now: float) -> tuple[_Ticket | None, float | None]:
+        """Highest-priority ready ticket, or the time until one becomes ready."""
+        earliest = None
+        for priority in Priority:
+            q = self._queues[priority]
+            i = 0
+            while i < min(len(q), SCAN_DEPTH):
+                ticket = q[i]
+                if ticket.granted.done():
+                    del q[i]
+                    continue
+                if ticket.expires_at is not None and ticket.expires_at <= now:
+                    del q[i]
+                    self._reject(ticket, "stale")
+                    continue
+                ready_at = self._next_chat_slot.get(ticket.chat_id, 0.0) if ticket.chat_id is not None else 0.0
+                if ready_at <= now:
+                    del q[i]
+                    return ticket, None
+                earliest = ready_at if earliest is None else min(earliest, ready_at)
+                i += 1
+            if len(q) < self._limits[priority]:
+                self._not_full[priority].set()
+        return None, (earliest - now if earliest is not None else None)
+
+    async def _dispatch(self) -> None:
+        while True:
+            now = time.monotonic()
+            global_wait = max(self._next_slot, self._paused_until) - now
+            if global_wait > 0:
+                await asyncio.sleep(global_wait)
+                continue
+            ticket, wait = self._pick(now)
+            if ticket is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._next_slot = now + self.interval
+            if ticket.chat_id is not None:
+                self._next_chat_slot[ticket.chat_id] = now + self.chat_interval
+                if len(self._next_chat_slot) > 10_000:
+                    self._next_chat_slot = {k: v for k, v in self._next_chat_slot.items() if v > now}
+            self._merge_keys.discard(ticket.merge_key)
+            self._not_full[ticket.priority].set()
+            ticket.granted.set_result(None)
+
+    # -------------------- BaseRateLimiter --------------------
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        opts = rate_limit_args or {}
+        priority = Priority(opts.get("priority", Priority.INTERACTIVE))
+        ttl = opts.get("ttl")
+        merge_key = opts.get("merge_key")
+        if merge_key is not None:
+            if merge_key in self._merge_keys:
+                metrics.incr("dropped_merged")
+                raise Dropped("merged")
+            self._merge_keys.add(merge_key)
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            ticket = _Ticket(data.get("chat_id"), priority, expires_at, merge_key if attempt == 0 else None, loop.create_future())
+            try:
+                await self._wait_turn(ticket)
+            except asyncio.CancelledError:
+                self._merge_keys.discard(ticket.merge_key)
+                raise
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                self.pause(e.retry_after)
+                if attempt == self.max_retries:
+                    raise
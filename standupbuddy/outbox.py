@@ -0,0 +1,269 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from telegram import ForceReply
+from telegram.error import BadRequest, Forbidden
+
+from . import metrics, repo
+from .active import index as active
+from .config import (
+    OUTBOX_BATCH_SIZE, OUTBOX_MAX_BATCHES, OUTBOX_RESERVED_BATCHES, OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_BACKOFF_BASE_SEC, OUTBOX_BACKOFF_MAX_SEC, OUTBOX_IDLE_POLL_SEC,
+)
+from .fanout import fan_out
+from .outbound import Dropped, Priority
+from .utils import now_utc
+
+
+def is_unreachable(error: Exception) -> bool:
+    """The user blocked the bot, deleted their account or the chat is gone."""
+    if isinstance(error, Forbidden):
+        return True
+    return isinstance(error, BadRequest) and "chat not found" in error.message.lower()
+
+
+def backoff(attempts: int) -> float:
+    """Delay before retry number `attempts + 1`."""
+    return min(OUTBOX_BACKOFF_BASE_SEC * 2 ** attempts, OUTBOX_BACKOFF_MAX_SEC)
+
+
+class PromptRecorder:
+    """Records sent prompts as their sends complete rather than after the whole batch.
+
+    A user may answer a prompt while the rest of its batch is still waiting
+    for the rate limiter. The index learns about the prompt at once, and the
+    database in small batches: whatever completed while the last write ran.
+    """
+
+    def __init__(self):
+        self._rows: list[tuple[int, int, int]] = []
+        self._task: asyncio.Task | None = None
+
+    def add(self, chat_id: int, message_id: int, update_id: int) -> None:
+        row = (chat_id, message_id, update_id)
+        active.set_prompts([row])
+        self._rows.append(row)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._write())
+
+    async def _write(self) -> None:
+        while self._rows:
+            rows, self._rows = self._rows, []
+            try:
+                await repo.record_prompts(rows)
+            except Exception as e:
+                print(f"Outbox: recording {len(rows)} prompts failed, retrying at the end of the batch: {e!r}")
+                self._rows = rows + self._rows
+                return
+
+    async def flush(self) -> None:
+        if self._task:
+            await self._task
+        if self._rows:
+            rows, self._rows = self._rows, []
+            await repo.record_prompts(rows)
+
+
+class OutboxWorker:
+    """Drains the persisted `outbox` table through fan_out().
+
+    Producers queue messages with `send()`, which is one batched commit, and
+    the worker picks them up. Rows are claimed while in flight; on restart
+    claims are released so anything unsent goes out again. Transient failures
+    are retried with exponential backoff up to OUTBOX_MAX_ATTEMPTS; rejections
+    that cannot succeed on retry are dropped, and users who blocked the bot
+    are marked in `users.blocked_utc` so recipient queries skip them.
+    """
+
+    def __init__(self):
+        self.bot = None
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(OUTBOX_MAX_BATCHES)
+        self._task: asyncio.Task | None = None
+        self._batches: set[asyncio.Task] = set()
+        # Batches holding reminder/summary rows; they may not take the reserved slots.
+        self._bulk = 0
+        self._stopping = False
+
+    async def start(self, bot) -> None:
+        self.bot = bot
+        self._stopping = False
+        released = await repo.outbox_release_all()
+        if released:
+            print(f"Outbox: resuming {released} messages left from the previous run")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 0.0) -> None:
+        """Keep sending what is due for up to `timeout` seconds, then cancel.
+
+        Cancelled batches stay claimed and are released on the next start.
+        """
+        if self._task:
+            task, self._task = self._task, None
+            self._stopping = True
+            self.kick()
+            try:
+                await asyncio.wait_for(task, timeout)
+            except asyncio.TimeoutError:
+                pass
+        if self._batches:
+            print(f"Outbox: cancelling {len(self._batches)} batches in flight, they resume on next start")
+        for t in list(self._batches):
+            t.cancel()
+
+    def kick(self) -> None:
+        self._wakeup.set()
+
+    async def send(
+        self, messages: list[dict], label: str, priority: Priority, ttl: float | None = None, summary_of: int | None = None
+    ) -> int:
+        """Persist messages and wake the worker.
+
+        Each message is send_message kwargs plus optional `dedupe_key` and
+        `update_id`; for the latter the sent message id is recorded on that
+        `updates` row so replies can be matched to it. `summary_of` queues
+        them at most once per standup (see repo.outbox_add).
+        """
+        expires = (now_utc() + timedelta(seconds=ttl)).isoformat() if ttl is not None else None
+        rows = [{
+            "chat_id": m["chat_id"],
+            "text": m["text"],
+            "parse_mode": m.get("parse_mode"),
+            "force_reply": int(isinstance(m.get("reply_markup"), ForceReply)),
+            "priority": int(priority),
+            "label": label,
+            "dedupe_key": m.get("dedupe_key"),
+            "expires_utc": expires,
+            "update_id": m.get("update_id"),
+        } for m in messages]
+        queued = await repo.outbox_add(rows, summary_of)
+        self.kick()
+        return queued
+
+    async def _run(self) -> None:
+        while True:
+            await self._slots.acquire()
+            # A batch holds its slot until every row in it is sent, so bulk rows
+            # never get the last OUTBOX_RESERVED_BATCHES slots: a prompt queued
+            # behind a large summary is still claimed at once and the outbound
+            # scheduler can put it ahead.
+            capped = self._bulk >= OUTBOX_MAX_BATCHES - OUTBOX_RESERVED_BATCHES
+            if capped:
+                # Cleared before the claim so a send() after it still wakes us.
+                self._wakeup.clear()
+            try:
+                rows = await repo.outbox_claim_due(OUTBOX_BATCH_SIZE, Priority.PROMPT if capped else None)
+            except Exception as e:
+                self._slots.release()
+                print(f"Outbox: claim failed: {e}")
+                await asyncio.sleep(OUTBOX_IDLE_POLL_SEC)
+                continue
+            if rows:
+                # Claimed in priority order, so the last row tells if any is bulk.
+                bulk = rows[-1]["priority"] > Priority.PROMPT
+                self._bulk += bulk
+                task = asyncio.create_task(self._send_batch(rows, bulk))
+                self._batches.add(task)
+                task.add_done_callback(self._batches.discard)
+                continue
+            self._slots.release()
+            if self._stopping:
+                if not self._batches:
+                    return
+                # Batches in flight may settle rows that are due again at once.
+                await asyncio.wait(set(self._batches))
+                continue
+            if capped:
+                # Bulk rows may be due; wait for a bulk slot or new urgent rows.
+                await self._wait_capped()
+                continue
+            await self._idle()
+
+    async def _wait_capped(self) -> None:
+        wakeup = asyncio.ensure_future(self._wakeup.wait())
+        try:
+            await asyncio.wait({wakeup, *self._batches}, timeout=OUTBOX_IDLE_POLL_SEC, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            wakeup.cancel()
+
+    async def _idle(self) -> None:
+        timeout = OUTBOX_IDLE_POLL_SEC
+        next_due = await repo.outbox_next_due()
+        if next_due:
+            timeout = min(timeout, max(0.0, (datetime.fromisoformat(next_due) - now_utc()).total_seconds()))
+        self._wakeup.clear()
+        if self._stopping:
+            return
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _send_batch(self, rows, bulk: bool) -> None:
+        try:
+            now = now_utc()
+            done, release, live = [], [], []
+            for r in rows:
+                if r["expires_utc"] and datetime.fromisoformat(r["expires_utc"]) <= now:
+                    metrics.incr("outbox_expired")
+                    done.append(r["id"])
+                else:
+                    live.append(r)
+            retry, unreachable, prompts = [], set(), PromptRecorder()
+            groups: dict[tuple, list] = {}
+            for r in live:
+                groups.setdefault((r["priority"], r["label"]), []).append(r)
+            results = await asyncio.gather(*(self._deliver(p, label, group, prompts) for (p, label), group in groups.items()))
+            await prompts.flush()
+            for group, result in zip(groups.values(), results):
+                for r, outcome in zip(group, result.results):
+                    if not isinstance(outcome, Exception):
+                        done.append(r["id"])
+                    elif isinstance(outcome, Dropped):
+                        (release if str(outcome) == "shutdown" else done).append(r["id"])
+                    elif is_unreachable(outcome):
+                        unreachable.add(r["chat_id"])
+                        done.append(r["id"])
+                    elif isinstance(outcome, BadRequest) or r["attempts"] + 1 >= OUTBOX_MAX_ATTEMPTS:
+                        metrics.incr("outbox_dead")
+                        print(f"Outbox: giving up on message {r['id']} to {r['chat_id']}: {outcome}")
+                        done.append(r["id"])
+                    else:
+                        next_at = (now_utc() + timedelta(seconds=backoff(r["attempts"]))).isoformat()
+                        retry.append((next_at, str(outcome)[:500], r["id"]))
+            await repo.outbox_settle(done, retry, release)
+            metrics.incr("outbox_retried", len(retry))
+            if unreachable:
+                await repo.mark_blocked(sorted(unreachable))
+                metrics.incr("users_blocked", len(unreachable))
+                print(f"Outbox: {len(unreachable)} users unreachable, excluded from future sends")
+        finally:
+            self._bulk -= bulk
+            self._slots.release()
+            self.kick()
+
+    async def _deliver(self, priority: int, label: str | None, rows, prompts: PromptRecorder):
+        messages, merge_keys = [], []
+        ttl_now = now_utc()
+        for r in rows:
+            msg = {"chat_id": r["chat_id"], "text": r["text"]}
+            if r["parse_mode"]:
+                msg["parse_mode"] = r["parse_mode"]
+            if r["force_reply"]:
+                msg["reply_markup"] = ForceReply(selective=True)
+            messages.append(msg)
+            merge_keys.append(r["dedupe_key"])
+        ttls = [
+            (datetime.fromisoformat(r["expires_utc"]) - ttl_now).total_seconds() if r["expires_utc"] else None
+            for r in rows
+        ]
+        def on_sent(i, message):
+            if rows[i]["update_id"]:
+                prompts.add(rows[i]["chat_id"], message.message_id, rows[i]["update_id"])
+
+        return await fan_out(
+            self.bot, messages, label or "outbox", Priority(priority), ttls=ttls, merge_keys=merge_keys, on_sent=on_sent,
+        )
+
+
+worker = OutboxWorker()
@@ -0,0 +1,146 @@
+import asyncio
+import json
+import pickle
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from . import repo
+from .config import PERSISTENCE_INTERVAL_SEC
+
+
+class SQLitePersistence(BasePersistence):
+    """user_data and ConversationHandler states, one row per key in SQLite.
+
+    The Application hands over the keys touched since its last round every
+    `update_interval` seconds; they are collected here and written in a
+    single transaction per round, and user_data that pickles to the same
+    bytes as the last write is skipped. user_data is loaded per user on their
+    first update rather than all at startup. bot_data, chat_data and callback
+    data are not stored.
+    """
+
+    def __init__(self, update_interval: float = PERSISTENCE_INTERVAL_SEC):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        # uid -> its pending load, or None once loaded.
+        self._loaded: dict[int, asyncio.Future | None] = {}
+        # uid -> hash of the blob last read or written, to skip no-op writes.
+        self._stored: dict[int, int] = {}
+        # Pending writes; None deletes the row.
+        self._users: dict[int, bytes | None] = {}
+        self._conversations: dict[tuple[str, str], str | None] = {}
+        self._write_task: asyncio.Task | None = None
+        self._lock = asyncio.Lock()
+
+    # user_data
+
+    async def get_user_data(self) -> dict:
+        return {}
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        if user_id in self._loaded:
+            # Concurrent updates from the same user wait for the one load.
+            loading = self._loaded[user_id]
+            if loading is not None:
+                await asyncio.shield(loading)
+            return
+        loading = self._loaded[user_id] = asyncio.ensure_future(repo.load_user_data(user_id))
+        try:
+            blob = await loading
+        except Exception:
+            del self._loaded[user_id]
+            raise
+        self._loaded[user_id] = None
+        if blob is not None:
+            self._stored[user_id] = hash(blob)
+            # Whatever this process already put there is newer.
+            for key, value in pickle.loads(blob).items():
+                user_data.setdefault(key, value)
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        blob = pickle.dumps(data)
+        if user_id not in self._users and self._stored.get(user_id) == hash(blob):
+            return
+        self._users[user_id] = blob
+        self._schedule_write()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._users[user_id] = None
+        self._schedule_write()
+
+    # conversations
+
+    async def get_conversations(self, name: str) -> dict:
+        return {tuple(json.loads(key)): json.loads(state) for key, state in await repo.load_conversations(name)}
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        self._conversations[(name, json.dumps(key))] = None if new_state is None else json.dumps(new_state)
+        self._schedule_write()
+
+    # writes
+
+    def _schedule_write(self) -> None:
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.create_task(self._write())
+
+    async def _write(self) -> None:
+        # The Application gathers one update_* call per key; let the rest of
+        # this round land before taking the batch.
+        await asyncio.sleep(0)
+        async with self._lock:
+            # Anything queued while a batch was being written goes in the next one;
+            # _schedule_write() does not start a task while this one runs.
+            while self._users or self._conversations:
+                users, self._users = self._users, {}
+                conversations, self._conversations = self._conversations, {}
+                try:
+                    await repo.save_persistence(users, conversations)
+                except Exception as e:
+                    print(f"Persistence: writing {len(users)} users, {len(conversations)} conversations failed: {e!r}")
+                    # Keep them for the next round unless something newer came in.
+                    for uid, blob in users.items():
+                        self._users.setdefault(uid, blob)
+                    for key, state in conversations.items():
+                        self._conversations.setdefault(key, state)
+                    return
+                for uid, blob in users.items():
+                    if blob is None:
+                        self._stored.pop(uid, None)
+                    else:
+                        self._stored[uid] = hash(blob)
+
+    async def flush(self) -> None:
+        if self._write_task:
+            await self._write_task
+        await self._write()
+
+    # Not stored.
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def update_bot_data(self, data) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data) -> None:
+        pass
+
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def update_chat_data(self, chat_id: int, data) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_callback_data(self, data) -> None:
+        pass
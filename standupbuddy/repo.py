@@ -0,0 +1,527 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from .cache import team_cache, team_lists
+from .config import DB_POOL_SIZE, REMIND_AFTER_MIN, SUMMARY_AFTER_MIN
+from .db import connection
+from .utils import next_run_utc, today_in_tz, now_utc
+
+
+# One worker per pooled connection, so a worker never waits on the pool.
+_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="sqlite")
+
+
+def _call(fn, args):
+    with connection() as conn:
+        return fn(conn, *args)
+
+
+async def run_db(fn, *args):
+    """Run `fn(conn, *args)` on the DB executor with a pooled connection."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, _call, fn, args)
+
+
+def repository(fn):
+    """Turn a blocking `fn(conn, ...)` query into an awaitable `fn(...)`.
+
+    The blocking version stays reachable as `.sync` for callers that already
+    hold a connection (scripts, benchmarks).
+    """
+    @functools.wraps(fn)
+    async def wrapper(*args):
+        return await run_db(fn, *args)
+    wrapper.sync = fn
+    return wrapper
+
+
+def shutdown() -> None:
+    _executor.shutdown(wait=True)
+
+
+# -------------------- users --------------------
+
+@repository
+def upsert_user(conn, tg_id: int, name: str) -> None:
+    """Create or rename a user; a user who was marked blocked is active again."""
+    with conn:
+        conn.execute(
+            "INSERT INTO users (tg_id, name) VALUES (?, ?) ON CONFLICT(tg_id) DO UPDATE SET name=excluded.name, blocked_utc=NULL",
+            (tg_id, name),
+        )
+
+
+@repository
+def mark_blocked(conn, tg_ids: list[int]) -> None:
+    """Record users the bot can no longer reach and drop their queued messages."""
+    now = now_utc().isoformat()
+    with conn:
+        conn.executemany("UPDATE users SET blocked_utc=? WHERE tg_id=? AND blocked_utc IS NULL", [(now, uid) for uid in tg_ids])
+        conn.executemany("DELETE FROM outbox WHERE chat_id=? AND claimed=0", [(uid,) for uid in tg_ids])
+
+
+@repository
+def ping(conn) -> bool:
+    conn.execute("SELECT 1")
+    return True
+
+
+# -------------------- teams --------------------
+
+TEAM_COLUMNS = "id, name, tz, reminder_time, reminder_days, invite_code, next_run_utc"
+
+
+def _team_for(conn, team_id: int, uid: int):
+    return conn.execute(
+        f"""
+        SELECT {TEAM_COLUMNS},
+               EXISTS(SELECT 1 FROM team_managers WHERE team_id=t.id AND tg_id=?) AS is_manager
+        FROM teams t WHERE id=?
+        """,
+        (uid, team_id),
+    ).fetchone()
+
+
+def _load_team(conn, team_id: int):
+    row = conn.execute(f"SELECT {TEAM_COLUMNS} FROM teams WHERE id=?", (team_id,)).fetchone()
+    if not row:
+        return None
+    managers = frozenset(r[0] for r in conn.execute("SELECT tg_id FROM team_managers WHERE team_id=?", (team_id,)))
+    members = frozenset(r[0] for r in conn.execute("SELECT tg_id FROM team_members WHERE team_id=?", (team_id,)))
+    return dict(row), managers, members
+
+
+async def get_team(team_id: int, uid: int):
+    """Team row plus `is_manager`/`is_member` flags for `uid`, read through team_cache.
+
+    Every write to a team's row, managers or members must invalidate it.
+    """
+    entry = team_cache.get(team_id)
+    if entry is None:
+        generation = team_cache.generation
+        entry = await run_db(_load_team, team_id)
+        if entry is None:
+            return None
+        team_cache.put(team_id, entry, generation)
+    row, managers, members = entry
+    return {**row, "is_manager": uid in managers, "is_member": uid in members}
+
+
+@repository
+def user_teams(conn, uid: int):
+    return conn.execute(
+        "SELECT t.id, t.name FROM teams t JOIN team_members m ON m.team_id=t.id WHERE m.tg_id=? ORDER BY t.id",
+        (uid,),
+    ).fetchall()
+
+
+@repository
+def team_member_names(conn, team_id: int):
+    return conn.execute(
+        """
+        SELECT u.tg_id, u.name, mg.tg_id IS NOT NULL AS is_manager
+        FROM team_members tm
+        JOIN users u ON u.tg_id=tm.tg_id
+        LEFT JOIN team_managers mg ON mg.team_id=tm.team_id AND mg.tg_id=tm.tg_id
+        WHERE tm.team_id=?
+        ORDER BY u.name COLLATE NOCASE
+        """,
+        (team_id,),
+    ).fetchall()
+
+
+@repository
+def create_team(conn, name: str, code: str, manager_id: int) -> int:
+    with conn:
+        cur = conn.execute(
+            "INSERT INTO teams (name, invite_code, tz, reminder_time, reminder_days) VALUES (?, ?, 'UTC', NULL, NULL)",
+            (name, code),
+        )
+        team_id = cur.lastrowid
+        conn.execute("INSERT OR IGNORE INTO team_members (team_id, tg_id) VALUES (?, ?)", (team_id, manager_id))
+        conn.execute("INSERT OR IGNORE INTO team_managers (team_id, tg_id) VALUES (?, ?)", (team_id, manager_id))
+    team_cache.invalidate(team_id)
+    team_lists.invalidate(manager_id)
+    return team_id
+
+
+@repository
+def join_team(conn, code: str, uid: int):
+    team = conn.execute("SELECT id, name FROM teams WHERE invite_code=?", (code,)).fetchone()
+    if team:
+        with conn:
+            conn.execute("INSERT OR IGNORE INTO team_members (team_id, tg_id) VALUES (?, ?)", (team["id"], uid))
+        team_cache.invalidate(team["id"])
+        team_lists.invalidate(uid)
+    return team
+
+
+@repository
+def remove_member(conn, team_id: int, uid: int) -> bool:
+    """Drop `uid` from the team. Returns False (and changes nothing) if they are its only manager."""
+    with conn:
+        # The count is evaluated inside the DELETE, so two managers leaving at
+        # the same time cannot both pass the "someone else is left" check.
+        conn.execute(
+            "DELETE FROM team_managers WHERE team_id=? AND tg_id=? AND (SELECT COUNT(*) FROM team_managers WHERE team_id=?) > 1",
+            (team_id, uid, team_id),
+        )
+        if conn.execute("SELECT 1 FROM team_managers WHERE team_id=? AND tg_id=?", (team_id, uid)).fetchone():
+            return False
+        conn.execute("DELETE FROM team_members WHERE team_id=? AND tg_id=?", (team_id, uid))
+    team_cache.invalidate(team_id)
+    team_lists.invalidate(uid)
+    return True
+
+
+@repository
+def save_schedule(conn, team_id: int, hhmm: str, tz_name: str, days_json: str) -> None:
+    next_run = next_run_utc(hhmm, tz_name, days_json).isoformat()
+    with conn:
+        conn.execute(
+            "UPDATE teams SET reminder_time=?, tz=?, reminder_days=?, next_run_utc=? WHERE id=?",
+            (hhmm, tz_name, days_json, next_run, team_id),
+        )
+    team_cache.invalidate(team_id)
+
+
+@repository
+def clear_schedule(conn, team_id: int, uid: int):
+    with conn:
+        conn.execute("UPDATE teams SET reminder_time=NULL, reminder_days=NULL, next_run_utc=NULL WHERE id=?", (team_id,))
+    team_cache.invalidate(team_id)
+    return _team_for(conn, team_id, uid)
+
+
+@repository
+def get_schedule(conn, team_id: int):
+    return conn.execute("SELECT reminder_time, tz, reminder_days FROM teams WHERE id=?", (team_id,)).fetchone()
+
+
+@repository
+def team_schedules(conn):
+    return conn.execute(
+        "SELECT id, reminder_time, tz, reminder_days, next_run_utc FROM teams WHERE reminder_time IS NOT NULL"
+    ).fetchall()
+
+
+@repository
+def teams_due_between(conn, start: str, end: str) -> list[int]:
+    """Scheduled teams whose next run falls in [start, end], by the next_run_utc index."""
+    rows = conn.execute("SELECT id FROM teams WHERE next_run_utc BETWEEN ? AND ?", (start, end)).fetchall()
+    return [r["id"] for r in rows]
+
+
+@repository
+def set_next_runs(conn, rows: list[tuple[str, int]]) -> None:
+    """Store (next_run_utc, team_id) pairs in one transaction."""
+    with conn:
+        conn.executemany("UPDATE teams SET next_run_utc=? WHERE id=?", rows)
+    team_cache.invalidate(*(team_id for _, team_id in rows))
+
+
+# -------------------- standups --------------------
+
+def _active(alias: str) -> str:
+    """Recipient filter: users who blocked the bot (or deleted their account) get no messages."""
+    return f"NOT EXISTS (SELECT 1 FROM users bu WHERE bu.tg_id={alias}.tg_id AND bu.blocked_utc IS NOT NULL)"
+
+
+@repository
+def create_standup(conn, team_id: int, manual: bool):
+    """Open today's standup for a team. Returns (team, standup_id, [(update_id, tg_id)]) or None.
+
+    The standup row, one `updates` row per member and the reminder/summary
+    timers are created in one transaction; the member ids come back from the
+    bulk insert itself via RETURNING.
+    """
+    team = conn.execute("SELECT id, name, tz FROM teams WHERE id=?", (team_id,)).fetchone()
+    if not team:
+        return None
+    today = today_in_tz(team["tz"]).isoformat()
+    started = now_utc()
+    with conn:
+        cur = conn.execute(
+            f"""
+            INSERT INTO standups (team_id, date_iso, started_utc)
+            SELECT ?, ?, ?
+            WHERE EXISTS (SELECT 1 FROM team_members tm WHERE tm.team_id=? AND {_active('tm')})
+              AND (? OR NOT EXISTS (SELECT 1 FROM standups WHERE team_id=? AND date_iso=?))
+            """,
+            (team_id, today, started.isoformat(), team_id, manual, team_id, today),
+        )
+        if not cur.rowcount:
+            return None
+        standup_id = cur.lastrowid
+        members = [(r[0], r[1]) for r in conn.execute(
+            f"INSERT INTO updates (standup_id, tg_id, answered) SELECT ?, tm.tg_id, 0 FROM team_members tm WHERE tm.team_id=? AND {_active('tm')} RETURNING id, tg_id",
+            (standup_id, team_id),
+        ).fetchall()]
+        timer_keys = []
+        for kind, after in (("remind", REMIND_AFTER_MIN), ("summary", SUMMARY_AFTER_MIN)):
+            timer_id = conn.execute(
+                "INSERT INTO timers (kind, standup_id, team_id, due_utc) VALUES (?, ?, ?, ?) RETURNING id",
+                (kind, standup_id, team_id, (started + timedelta(minutes=after)).isoformat()),
+            ).fetchone()[0]
+            timer_keys.append(f"timer:{timer_id}")
+        conn.execute("UPDATE standups SET remind_job_key=?, summary_job_key=? WHERE id=?", (*timer_keys, standup_id))
+    return team, standup_id, members
+
+
+@repository
+def unanswered(conn, team_id: int, standup_id: int):
+    """(team, [(update_id, tg_id)]) of members who have not answered yet."""
+    team = conn.execute("SELECT name FROM teams WHERE id=?", (team_id,)).fetchone()
+    rows = conn.execute(
+        f"SELECT upd.id, upd.tg_id FROM updates upd WHERE upd.standup_id=? AND upd.answered=0 AND {_active('upd')}",
+        (standup_id,),
+    ).fetchall()
+    return team, [(r["id"], r["tg_id"]) for r in rows]
+
+
+@repository
+def summary_rows(conn, team_id: int, standup_id: int):
+    """Close the standup to further answers and return (team, manager ids, member rows)."""
+    with conn:
+        conn.execute("UPDATE standups SET closed_utc=COALESCE(closed_utc, ?) WHERE id=?", (now_utc().isoformat(), standup_id))
+    team = conn.execute("SELECT name FROM teams WHERE id=?", (team_id,)).fetchone()
+    managers = [r["tg_id"] for r in conn.execute(
+        f"SELECT tm.tg_id FROM team_managers tm WHERE tm.team_id=? AND {_active('tm')}", (team_id,)
+    ).fetchall()]
+    members = conn.execute(
+        """
+        SELECT u.tg_id, u.name, COALESCE(upd.text, '') AS text, upd.answered AS answered,
+               u.blocked_utc IS NOT NULL AS blocked
+        FROM team_members tm
+        JOIN users u ON u.tg_id = tm.tg_id
+        LEFT JOIN updates upd ON upd.tg_id = tm.tg_id AND upd.standup_id=?
+        WHERE tm.team_id=?
+        ORDER BY u.name COLLATE NOCASE
+        """,
+        (standup_id, team_id),
+    ).fetchall()
+    return team, managers, members
+
+
+@repository
+def record_answer(
+    conn, uid: int, text: str, chat_id: int | None = None, reply_to: int | None = None, reply_to_bot: bool = False,
+) -> str:
+    """Store a reply and say where it went: "accepted", "closed", "ambiguous" or "none".
+
+    A reply to a standup prompt or reminder is matched by that message's
+    (chat_id, message_id). A reply to some other message of the bot is
+    "none": it was meant for something, and guessing could put it in the
+    wrong team. Anything else is accepted only if the user has exactly one
+    open standup waiting for an answer.
+    """
+    with conn:
+        target = None
+        if reply_to is not None:
+            row = conn.execute(
+                """
+                SELECT u.id, u.answered, s.closed_utc
+                FROM prompt_messages pm
+                JOIN updates u ON u.id = pm.update_id
+                JOIN standups s ON s.id = u.standup_id
+                WHERE pm.chat_id=? AND pm.message_id=? AND u.tg_id=?
+                """,
+                (chat_id, reply_to, uid),
+            ).fetchone()
+            if row and row["closed_utc"]:
+                return "closed"
+            if row and row["answered"]:
+                return "none"
+            if not row and reply_to_bot:
+                return "none"
+            target = row["id"] if row else None
+        if target is None:
+            open_ids = [r["id"] for r in conn.execute(
+                """
+                SELECT u.id FROM updates u JOIN standups s ON s.id = u.standup_id
+                WHERE u.tg_id=? AND u.answered=0 AND s.closed_utc IS NULL LIMIT 2
+                """,
+                (uid,),
+            ).fetchall()]
+            if len(open_ids) != 1:
+                return "ambiguous" if open_ids else "none"
+            target = open_ids[0]
+        conn.execute("UPDATE updates SET text=?, created_utc=?, answered=1 WHERE id=?", (text, now_utc().isoformat(), target))
+    return "accepted"
+
+
+@repository
+def answer_update(conn, update_id: int, standup_id: int, text: str) -> bool:
+    """Answer one known update if it is still unanswered and its standup open."""
+    with conn:
+        cur = conn.execute(
+            """
+            UPDATE updates SET text=?, created_utc=?, answered=1
+            WHERE id=? AND answered=0 AND EXISTS (SELECT 1 FROM standups WHERE id=? AND closed_utc IS NULL)
+            """,
+            (text, now_utc().isoformat(), update_id, standup_id),
+        )
+    return cur.rowcount > 0
+
+
+@repository
+def open_updates(conn):
+    """Unanswered updates of open standups, oldest standup first, with its age in seconds.
+
+    One row per prompt or reminder message sent for the update, or one with
+    NULL chat and message ids if none was sent yet.
+    """
+    return conn.execute(
+        """
+        SELECT u.standup_id, u.id, u.tg_id, pm.chat_id, pm.message_id,
+               (julianday('now') - julianday(s.started_utc)) * 86400 AS age
+        FROM standups s JOIN updates u ON u.standup_id = s.id
+        LEFT JOIN prompt_messages pm ON pm.update_id = u.id
+        WHERE s.closed_utc IS NULL AND u.answered=0
+        ORDER BY s.id
+        """
+    ).fetchall()
+
+
+@repository
+def record_prompts(conn, rows: list[tuple[int, int, int]]) -> None:
+    """Remember sent prompts and reminders for their updates: (chat_id, message_id, update_id)."""
+    with conn:
+        conn.executemany("INSERT OR IGNORE INTO prompt_messages (chat_id, message_id, update_id) VALUES (?, ?, ?)", rows)
+
+
+# -------------------- timers --------------------
+
+@repository
+def due_timers(conn, limit: int):
+    return conn.execute(
+        "SELECT id, kind, standup_id, team_id, due_utc FROM timers WHERE due_utc<=? ORDER BY due_utc LIMIT ?",
+        (now_utc().isoformat(), limit),
+    ).fetchall()
+
+
+@repository
+def next_timer_due(conn) -> str | None:
+    return conn.execute("SELECT MIN(due_utc) FROM timers").fetchone()[0]
+
+
+@repository
+def settle_timers(conn, done: list[int], retry: list[tuple[str, int]]) -> None:
+    """Delete fired timers and push failed ones back to (due_utc, id)."""
+    with conn:
+        conn.executemany("DELETE FROM timers WHERE id=?", [(i,) for i in done])
+        conn.executemany("UPDATE timers SET due_utc=? WHERE id=?", retry)
+
+
+# -------------------- outbox --------------------
+
+OUTBOX_COLUMNS = "id, chat_id, text, parse_mode, force_reply, priority, label, dedupe_key, attempts, expires_utc, update_id"
+
+
+@repository
+def outbox_add(conn, rows: list[dict], summary_of: int | None = None) -> int:
+    """Queue messages in one transaction. Rows with an already queued dedupe_key are skipped.
+
+    With `summary_of`, the rows are that standup's summary: they are queued
+    only if it was not queued before, and the standup is marked in the same
+    transaction.
+    """
+    now = now_utc().isoformat()
+    with conn:
+        if summary_of is not None:
+            cur = conn.execute("UPDATE standups SET summary_utc=? WHERE id=? AND summary_utc IS NULL", (now, summary_of))
+            if cur.rowcount == 0:
+                return 0
+        cur = conn.executemany(
+            """
+            INSERT OR IGNORE INTO outbox
+                (chat_id, text, parse_mode, force_reply, priority, label, dedupe_key, next_attempt_utc, expires_utc, update_id, created_utc)
+            VALUES (:chat_id, :text, :parse_mode, :force_reply, :priority, :label, :dedupe_key, :now, :expires_utc, :update_id, :now)
+            """,
+            [
+                {"parse_mode": None, "force_reply": 0, "label": None, "dedupe_key": None, "expires_utc": None, "update_id": None, **r, "now": now}
+                for r in rows
+            ],
+        )
+    return cur.rowcount
+
+
+@repository
+def outbox_claim_due(conn, limit: int, max_priority: int | None = None):
+    """Claim up to `limit` due rows, most urgent first; only priorities <= `max_priority` if given."""
+    now = now_utc().isoformat()
+    with conn:
+        return conn.execute(
+            f"""
+            UPDATE outbox SET claimed=1
+            WHERE id IN (
+                SELECT id FROM outbox WHERE claimed=0 AND next_attempt_utc<=? AND (? IS NULL OR priority<=?)
+                ORDER BY priority, id LIMIT ?
+            )
+            RETURNING {OUTBOX_COLUMNS}
+            """,
+            (now, max_priority, max_priority, limit),
+        ).fetchall()
+
+
+@repository
+def outbox_next_due(conn) -> str | None:
+    return conn.execute("SELECT MIN(next_attempt_utc) FROM outbox WHERE claimed=0").fetchone()[0]
+
+
+@repository
+def outbox_release_all(conn) -> int:
+    """Unclaim rows left over from a previous process so they are sent again."""
+    with conn:
+        return conn.execute("UPDATE outbox SET claimed=0 WHERE claimed=1").rowcount
+
+
+@repository
+def outbox_settle(conn, done: list[int], retry: list[tuple[str, str, int]], release: list[int]) -> None:
+    """Apply a batch's outcome: delete `done`, reschedule `retry` (next_attempt, error, id), unclaim `release`."""
+    with conn:
+        conn.executemany("DELETE FROM outbox WHERE id=?", [(i,) for i in done])
+        conn.executemany(
+            "UPDATE outbox SET claimed=0, attempts=attempts+1, next_attempt_utc=?, last_error=? WHERE id=?",
+            retry,
+        )
+        conn.executemany("UPDATE outbox SET claimed=0 WHERE id=?", [(i,) for i in release])
+
+
+@repository
+def outbox_depth(conn) -> int:
+    return conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+
+# -------------------- persistence --------------------
+
+@repository
+def load_user_data(conn, uid: int) -> bytes | None:
+    row = conn.execute("SELECT data FROM user_data WHERE tg_id=?", (uid,)).fetchone()
+    return row[0] if row else None
+
+
+@repository
+def load_conversations(conn, name: str):
+    return conn.execute("SELECT key, state FROM conversations WHERE name=?", (name,)).fetchall()
+
+
+@repository
+def save_persistence(conn, users: dict, conversations: dict) -> None:
+    """Write {uid: blob} and {(name, key): state} in one transaction; None values delete the row."""
+    with conn:
+        conn.executemany(
+            "INSERT INTO user_data (tg_id, data) VALUES (?, ?) ON CONFLICT(tg_id) DO UPDATE SET data=excluded.data",
+            [(uid, blob) for uid, blob in users.items() if blob is not None],
+        )
+        conn.executemany("DELETE FROM user_data WHERE tg_id=?", [(uid,) for uid, blob in users.items() if blob is None])
+        conn.executemany(
+            "INSERT INTO conversations (name, key, state) VALUES (?, ?, ?) ON CONFLICT(name, key) DO UPDATE SET state=excluded.state",
+            [(name, key, state) for (name, key), state in conversations.items() if state is not None],
+        )
+        conn.executemany(
+            "DELETE FROM conversations WHERE name=? AND key=?",
+            [(name, key) for (name, key), state in conversations.items() if state is None],
+        )
@@ -0,0 +1,125 @@
+import asyncio
+import time
+from datetime import datetime, time as dt_time, timezone
+
+from telegram.ext import Application, ContextTypes
+
+from . import repo
+from .utils import next_fire_utc
+
+MINUTES_PER_WEEK = 7 * 24 * 60
+# The Unix epoch was a Thursday; shifts epoch minutes so Monday 00:00 UTC is 0.
+_EPOCH_WEEKDAY_SHIFT = 3 * 24 * 60
+# Minutes a late tick looks back, so a stalled loop does not skip teams.
+MAX_CATCHUP_MIN = 15
+
+
+def minute_of_week(epoch_minute: int) -> int:
+    return (epoch_minute + _EPOCH_WEEKDAY_SHIFT) % MINUTES_PER_WEEK
+
+
+class MinuteScheduler:
+    """Daily standups for every team, driven by one JobQueue tick per minute.
+
+    Teams sit in buckets keyed by UTC minute-of-week, one slot per local
+    weekday they run on. Each tick starts every team in the current bucket as
+    one batch. A slot is computed from the UTC offset of its next occurrence,
+    so after a team fires its slots are recomputed to follow DST changes, and
+    the new `teams.next_run_utc` values are written back in one statement.
+    """
+
+    def __init__(self, start):
+        self.start_team = start
+        self._buckets: dict[int, set[int]] = {}
+        self._slots: dict[int, tuple[int, ...]] = {}
+        self._schedules: dict[int, tuple] = {}
+        self._last_minute: int | None = None
+
+    def __len__(self) -> int:
+        return len(self._schedules)
+
+    def set_team(self, team_id: int, hhmm: dt_time, tz_name: str, days, now: datetime | None = None) -> None:
+        self.remove_team(team_id)
+        self._schedules[team_id] = (hhmm, tz_name, tuple(days))
+        self._place(team_id, now or datetime.now(timezone.utc))
+
+    def load(self, schedules, now: datetime | None = None) -> dict[int, datetime]:
+        """Replace every schedule with `(team_id, hhmm, tz_name, days)` tuples in one pass.
+
+        Returns each team's next run in UTC.
+        """
+        now = now or datetime.now(timezone.utc)
+        self._buckets.clear()
+        self._slots.clear()
+        self._schedules.clear()
+        keys_cache = {}
+        next_runs = {}
+        for team_id, hhmm, tz_name, days in schedules:
+            self._schedules[team_id] = (hhmm, tz_name, tuple(days))
+            next_runs[team_id] = self._place(team_id, now, keys_cache)
+        return next_runs
+
+    def remove_team(self, team_id: int) -> None:
+        self._schedules.pop(team_id, None)
+        self._unplace(team_id)
+
+    def _unplace(self, team_id: int) -> None:
+        for key in self._slots.pop(team_id, ()):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(team_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def _place(self, team_id: int, now: datetime, keys_cache: dict | None = None) -> datetime:
+        """Bucket a team by its next occurrences and return the earliest.
+
+        `keys_cache` shares the work between teams with equal schedules.
+        """
+        hhmm, tz_name, days = self._schedules[team_id]
+        cache_key = (hhmm, tz_name, days)
+        cached = keys_cache.get(cache_key) if keys_cache is not None else None
+        if cached is None:
+            runs = [next_fire_utc(hhmm, tz_name, weekday, now) for weekday in set(days)]
+            cached = (tuple(at.weekday() * 1440 + at.hour * 60 + at.minute for at in runs), min(runs))
+            if keys_cache is not None:
+                keys_cache[cache_key] = cached
+        keys, next_run = cached
+        for key in keys:
+            self._buckets.setdefault(key, set()).add(team_id)
+        self._slots[team_id] = keys
+        return next_run
+
+    def due(self, epoch_minute: int) -> set[int]:
+        return set(self._buckets.get(minute_of_week(epoch_minute), ()))
+
+    def start(self, app: Application) -> None:
+        first = 60 - time.time() % 60 + 0.5
+        app.job_queue.run_repeating(self._tick, interval=60, first=first, name="minute_tick")
+
+    async def _tick(self, ctx: ContextTypes.DEFAULT_TYPE) -> None:
+        current = int(time.time() // 60)
+        last = self._last_minute if self._last_minute is not None else current - 1
+        team_ids: set[int] = set()
+        for minute in range(max(last + 1, current - MAX_CATCHUP_MIN), current + 1):
+            team_ids |= self.due(minute)
+        self._last_minute = current
+        if team_ids:
+            await self.fire(ctx.application, team_ids)
+
+    async def fire(self, app: Application, team_ids) -> None:
+        started = time.perf_counter()
+        results = await asyncio.gather(*(self.start_team(app, t) for t in team_ids), return_exceptions=True)
+        now = datetime.now(timezone.utc)
+        keys_cache = {}
+        next_runs = []
+        for team_id in team_ids:
+            if team_id in self._schedules:
+                self._unplace(team_id)
+                next_runs.append((self._place(team_id, now, keys_cache).isoformat(), team_id))
+        await repo.set_next_runs(next_runs)
+        failed = [r for r in results if isinstance(r, Exception)]
+        for e in failed[:3]:
+            print(f"Scheduler: start failed: {e!r}")
+        print(f"Scheduler: started {len(team_ids) - len(failed)}/{len(team_ids)} standups in {time.perf_counter() - started:.2f}s")
+
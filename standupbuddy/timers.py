@@ -0,0 +1,93 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from telegram.ext import Application
+
+from . import repo
+from .config import TIMER_BATCH_SIZE, TIMER_CONCURRENCY, TIMER_RETRY_SEC, TIMER_IDLE_POLL_SEC
+from .utils import now_utc
+
+
+class TimerWorker:
+    """Fires the durable `timers` rows (reminders, summaries) when they come due.
+
+    Timers are written together with their standup, so they survive restarts;
+    on start every timer that came due while the bot was down fires in
+    batches of TIMER_BATCH_SIZE, at most TIMER_CONCURRENCY handlers at once.
+    Handlers are called as `handler(app, standup_id, team_id, due)` and must
+    be safe to run twice: a timer is deleted only after its handler returns.
+    """
+
+    def __init__(self, handlers: dict):
+        self.handlers = handlers
+        self.app: Application | None = None
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(TIMER_CONCURRENCY)
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+
+    async def start(self, app: Application) -> None:
+        self.app = app
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 0.0) -> None:
+        """Fire no new batches; the batch in flight gets up to `timeout` seconds."""
+        if not self._task:
+            return
+        task, self._task = self._task, None
+        self._stopping = True
+        self.kick()
+        try:
+            await asyncio.wait_for(task, timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def kick(self) -> None:
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                rows = await repo.due_timers(TIMER_BATCH_SIZE)
+                if rows:
+                    await self._fire(rows)
+                    continue
+                await self._idle()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Timers: {e!r}")
+                await asyncio.sleep(TIMER_IDLE_POLL_SEC)
+
+    async def _idle(self) -> None:
+        timeout = TIMER_IDLE_POLL_SEC
+        next_due = await repo.next_timer_due()
+        if next_due:
+            timeout = min(timeout, max(0.0, (datetime.fromisoformat(next_due) - now_utc()).total_seconds()))
+        self._wakeup.clear()
+        if self._stopping:
+            return
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _fire(self, rows) -> None:
+        async def run(r):
+            async with self._slots:
+                await self.handlers[r["kind"]](self.app, r["standup_id"], r["team_id"], datetime.fromisoformat(r["due_utc"]))
+
+        late = (now_utc() - datetime.fromisoformat(rows[0]["due_utc"])).total_seconds()
+        if late > TIMER_IDLE_POLL_SEC:
+            print(f"Timers: catching up on {len(rows)} timers, oldest {late:.0f}s overdue")
+        results = await asyncio.gather(*(run(r) for r in rows), return_exceptions=True)
+        done, retry = [], []
+        retry_at = (now_utc() + timedelta(seconds=TIMER_RETRY_SEC)).isoformat()
+        for r, result in zip(rows, results):
+            if isinstance(result, Exception):
+                print(f"Timers: {r['kind']} for standup {r['standup_id']} failed: {result!r}")
+                retry.append((retry_at, r["id"]))
+            else:
+                done.append(r["id"])
+        await repo.settle_timers(done, retry)
@@ -1,5 +1,7 @@
+import functools
 import json
 import random
+import re
 import string
 from datetime import datetime, timezone, time, timedelta
 
@@ -16,24 +18,37 @@ def now_utc() -> datetime:
     return datetime.now(timezone.utc)
 
 
+_UTC_OFFSET = re.compile(r"UTC(?:([+-])(\d{1,2})(?::?(\d{2}))?)?", re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=512)
+def parse_tz(tz_str: str):
+    """tzinfo for "UTC", "UTC+3", "UTC+5:30" or an IANA name such as "Europe/Moscow".
+
+    Raises ValueError for anything else. IANA zones keep their DST rules, so
+    localize with `tz.localize()` rather than `tzinfo=`.
+    """
+    s = (tz_str or "").strip()
+    m = _UTC_OFFSET.fullmatch(s)
+    if m:
+        sign, hours, minutes = m.groups()
+        if not sign:
+            return pytz.UTC
+        offset = int(hours) * 60 + int(minutes or 0)
+        if int(minutes or 0) >= 60 or offset > 14 * 60:
+            raise ValueError(f"UTC offset out of range: {tz_str!r}")
+        return pytz.FixedOffset(offset if sign == "+" else -offset)
+    try:
+        return pytz.timezone(s)
+    except pytz.UnknownTimeZoneError:
+        raise ValueError(f"unknown timezone: {tz_str!r}") from None
+
+
 def tz_from_str(tz_str: str):
-    if tz_str and tz_str.upper().startswith("UTC"):
-        rest = tz_str[3:]
-        sign = 1
-        if rest.startswith("+"):
-            rest = rest[1:]
-            sign = 1
-        elif rest.startswith("-"):
-            rest = rest[1:]
-            sign = -1
-        try:
-            hours = int(rest)
-            return pytz.FixedOffset(sign * hours * 60)
-        except Exception:
-            pass
+    """Like parse_tz(), but an unrecognised stored value falls back to UTC."""
     try:
-        return pytz.timezone(tz_str)
-    except Exception:
+        return parse_tz(tz_str)
+    except ValueError:
         return pytz.UTC
 
 
@@ -82,22 +97,22 @@ def days_to_label(days):
     return ", ".join(names[d] for d in days)
 
 
-def compute_next_run_local(reminder_time_str: str | None, tz_name: str, reminder_days_raw: str | None):
-    if not reminder_time_str:
-        return None
-    days = parse_reminder_days(reminder_days_raw)
-    if not days:
-        days = tuple(range(7))
+def next_fire_utc(hhmm: time, tz_name: str, weekday: int, after: datetime) -> datetime:
+    """Next UTC instant after `after` that is `hhmm` on local `weekday` in `tz_name`."""
     tz = tz_from_str(tz_name)
-    now = datetime.now(tz)
-    hhmm = parse_hhmm(reminder_time_str)
-    today_candidate = datetime(now.year, now.month, now.day, hhmm.hour, hhmm.minute, tzinfo=tz)
-    if now <= today_candidate and now.weekday() in days:
-        return today_candidate
-    for add_days in range(1, 15):
-        d = now + timedelta(days=add_days)
-        if d.weekday() in days:
-            return datetime(d.year, d.month, d.day, hhmm.hour, hhmm.minute, tzinfo=tz)
-    return None
+    local_now = after.astimezone(tz)
+    day = local_now.date() + timedelta(days=(weekday - local_now.weekday()) % 7)
+    while True:
+        at = tz.localize(datetime.combine(day, hhmm))
+        if at > after:
+            return at.astimezone(timezone.utc)
+        day += timedelta(days=7)
 
 
+def next_run_utc(reminder_time_str: str | None, tz_name: str, reminder_days_raw: str | None, after: datetime | None = None):
+    if not reminder_time_str:
+        return None
+    days = parse_reminder_days(reminder_days_raw) or tuple(range(7))
+    hhmm = parse_hhmm(reminder_time_str)
+    after = after or now_utc()
+    return min(next_fire_utc(hhmm, tz_name, d, after) for d in set(days))